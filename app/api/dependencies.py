@@ -1,18 +1,83 @@
-from fastapi import Depends, HTTPException, status, Request
+import hmac
+from decimal import Decimal
+from typing import Dict, Optional
+from fastapi import Depends, Header, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.database import get_session
-from models.base_user import BaseUser
-from services.base_user_services import UserService
-from services.auth_services import AuthService
+from database.config import settings
+from database.database import get_async_session
+from services.base_user_services import AsyncUserService
+from services.auth_services import AuthService, UserPrincipal, principal_cache
+from services.balance_services import known_insufficient
+from services.rate_limiter import get_rate_limiter, retry_after
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+def idempotency_key(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """Ключ идемпотентности запроса, если клиент его передал"""
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= settings.IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Недопустимый Idempotency-Key",
+        )
+    return idempotency_key
+
+def token_matches(provided: Optional[str], expected: Optional[str]) -> bool:
+    """Сравнение токена с настройкой; незаданная настройка не совпадает ни с чем"""
+    if not provided or not expected:
+        return False
+    # compare_digest: время сравнения не зависит от совпавшего префикса
+    return hmac.compare_digest(provided.encode(), expected.encode())
+
+def require_token(provided: Optional[str], expected: Optional[str]) -> None:
+    """Проверка токена из заголовка; без настройки доступ закрыт"""
+    if not expected:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Токен доступа не настроен",
+        )
+    if not token_matches(provided, expected):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недействительный токен",
+        )
+
+def verify_worker_token(x_worker_token: Optional[str] = Header(None)) -> None:
+    """Проверка токена воркера (WORKER_API_TOKEN)"""
+    require_token(x_worker_token, settings.WORKER_API_TOKEN)
+
+async def resolve_principal(payload: Dict, db: AsyncSession) -> Optional[UserPrincipal]:
+    """
+    Пользователь по данным токена: сначала подписанные claims (если им
+    доверяем), затем кэш по user_id и только при промахе - запрос к БД.
+    """
+    username = payload.get("sub")
+    user_id = payload.get("user_id")
+    if not username or not user_id:
+        return None
+
+    if settings.AUTH_TRUST_TOKEN_CLAIMS:
+        principal = UserPrincipal.from_claims(payload)
+        if principal is not None:
+            return principal if principal.is_active else None
+
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = await AsyncUserService(db).get_by_id(user_id)
+        if user is None:
+            return None
+        principal = UserPrincipal.from_user(user)
+        principal_cache.set(user_id, principal)
+
+    if principal.username != username or not principal.is_active:
+        return None
+    return principal
+
 async def get_current_user(
     request: Request,
-    db: Session = Depends(get_session)
-) -> BaseUser:
+    db: AsyncSession = Depends(get_async_session)
+) -> UserPrincipal:
     """Альтернатива для API-запросов с заголовком Authorization"""
     token = None
     
@@ -43,19 +108,40 @@ async def get_current_user(
             detail="Недействительный токен",
         )
     
-    username = payload.get("sub")
-    user_id = payload.get("user_id")
-    if not username or not user_id:
+    if not payload.get("sub") or not payload.get("user_id"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Недействительные данные токена",
         )
     
-    user = UserService(db).get_by_username(username)
-    if not user or str(user.user_id) != user_id:
+    user = await resolve_principal(payload, db)
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь не найден",
         )
     
-    return user
\ No newline at end of file
+    return user
+
+async def rate_limited_user(
+    current_user: UserPrincipal = Depends(get_current_user)
+) -> UserPrincipal:
+    """Текущий пользователь с проверкой лимита запросов его роли"""
+    if settings.RATE_LIMIT_ENABLED:
+        wait = await get_rate_limiter().acquire(current_user.user_id, current_user.role)
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов",
+                headers={"Retry-After": retry_after(wait)},
+            )
+    return current_user
+
+def check_funds(user: UserPrincipal, amount: Decimal) -> None:
+    """Отказ без обращения к БД, если недавно уже не хватило средств"""
+    if known_insufficient(user.user_id, amount):
+        # Тот же ответ, что и при неудачном списании в обработчике
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Insufficient funds",
+        )
@@ -0,0 +1,116 @@
+"""
+ASGI-middleware метрик и выборочного профилирования.
+
+Подключение в приложении:
+    install_metrics(app)
+
+Middleware подключает хуки SQL к движкам приложения (instrument_database).
+Каждый запрос получает RequestStats (число SQL и время БД), по
+окончании обновляются гистограммы по шаблону маршрута. Профилирование
+cProfile включается на лету (PUT /metrics/profiling) для 1 из N
+запросов; профили последних запросов доступны в GET /metrics/profiles.
+"""
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List
+from database.config import settings
+from services.metrics import (
+    RequestStats, db_queries_per_request, db_time_per_request, http_latency,
+    http_requests, instrument_database, n_plus_one, request_stats
+)
+
+logger = logging.getLogger(__name__)
+
+class Profiler:
+    """Выборочный cProfile; одновременно профилируется не больше одного запроса"""
+
+    def __init__(self, sample_rate: int = 0, keep: int = 20, top: int = 30):
+        self.sample_rate = sample_rate  # 1 из N запросов; 0 - выключено
+        self.top = top
+        self.profiles: Deque[Dict] = deque(maxlen=keep)
+        self._busy = threading.Lock()
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.randrange(self.sample_rate) == 0
+
+    def start(self):
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile: cProfile.Profile, route: str, elapsed: float) -> None:
+        profile.disable()
+        self._busy.release()
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+        self.profiles.append({'route': route, 'seconds': elapsed, 'stats': out.getvalue()})
+
+    def recent(self) -> List[Dict]:
+        return list(self.profiles)
+
+profiler = Profiler(sample_rate=settings.PROFILE_SAMPLE_RATE)
+
+def _route_template(scope) -> str:
+    # FastAPI кладёт сработавший маршрут в scope: метка - шаблон пути, а не сам путь
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+def install_metrics(app) -> None:
+    """MetricsMiddleware и роутер /metrics в приложении FastAPI"""
+    # Роутер импортирует profiler из этого модуля
+    from .routers import metrics
+
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router)
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        instrument_database()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        profile = profiler.start() if profiler.should_sample() else None
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+            route = _route_template(scope)
+            if profile is not None:
+                profiler.stop(profile, route, elapsed)
+            self._record(scope["method"], route, status_code, elapsed, stats)
+
+    @staticmethod
+    def _record(method: str, route: str, status_code: int, elapsed: float, stats: RequestStats) -> None:
+        http_requests.inc(method, route, str(status_code))
+        http_latency.observe(method, route, value=elapsed)
+        db_queries_per_request.observe(route, value=stats.queries)
+        db_time_per_request.observe(route, value=stats.db_seconds)
+        suspect = stats.suspected_n_plus_one()
+        if suspect is not None:
+            n_plus_one.inc(route)
+            statement, count = suspect
+            logger.warning("Possible N+1 in %s %s: %d executions of %s", method, route, count, statement[:200])
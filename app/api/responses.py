@@ -0,0 +1,25 @@
+"""
+Сериализация ответов через orjson.
+
+FastJSONResponse - класс ответа по умолчанию для роутеров (в приложении:
+FastAPI(default_response_class=FastJSONResponse)). Списки истории
+возвращают его напрямую из записей-dataclass со __slots__: orjson
+сериализует их без промежуточных dict и проверки response_model.
+Decimal, как и в pydantic, отдаётся строкой.
+"""
+from decimal import Decimal
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dump_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
@@ -2,15 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from database.database import get_session
+from database.database import get_async_session
 from database.config import settings
 from models.base_user import BaseUser
 from ..schemas import Token
 from services.auth_services import AuthService
-from services.base_user_services import UserService
+from services.base_user_services import AsyncUserService
+from services.password_hasher import HasherSaturatedError
+from services.auth_services import UserPrincipal
+from ..dependencies import resolve_principal
 from core.templates import templates
 
 router = APIRouter(
@@ -24,14 +27,21 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", scheme_name="BearerA
 async def login_for_access_token(
     response: Response,
     request: Request,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     form_data = await request.form()
     username = form_data.get("username")
     password = form_data.get("password")
     
-    user_service = UserService(db)
-    user = user_service.verify_user(username, password)
+    user_service = AsyncUserService(db)
+    try:
+        user = await user_service.verify_user(username, password)
+    except HasherSaturatedError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
     
     if not user:
         return templates.TemplateResponse(
@@ -41,7 +51,7 @@ async def login_for_access_token(
         )
     
     access_token = AuthService.create_access_token(
-        data={"sub": user.username, "user_id": str(user.user_id)}
+        data=AuthService.token_claims(user)
     )
     
     # Устанавливаем куку для веб-интерфейса
@@ -69,8 +79,8 @@ async def logout(request: Request):
 
 async def get_current_user(
     request: Request,
-    db: Session = Depends(get_session)
-) -> BaseUser:
+    db: AsyncSession = Depends(get_async_session)
+) -> UserPrincipal:
     """Получение текущего пользователя из куки"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -89,16 +99,11 @@ async def get_current_user(
         if payload is None:
             raise credentials_exception
             
-        username: str = payload.get("sub")
-        user_id: str = payload.get("user_id")
-        if username is None or user_id is None:
-            raise credentials_exception
-            
     except (JWTError, AttributeError):
         raise credentials_exception
     
-    user = UserService(db).get_by_username(username)
-    if user is None or str(user.user_id) != user_id:
+    user = await resolve_principal(payload, db)
+    if user is None:
         raise credentials_exception
         
     return user
\ No newline at end of file
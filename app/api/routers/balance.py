@@ -1,43 +1,74 @@
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from ..schemas import TransactionCreate, TransactionResponse, BalanceResponse
-from services.balance_services import BalanceService
-from ..dependencies import get_current_user
-from database.database import get_session
-from models.base_user import BaseUser
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..schemas import TransactionCreate, TransactionResponse, BalanceResponse, UsageSummaryResponse
+from services.balance_services import AsyncBalanceService, forget_insufficient
+from services.idempotency import AsyncIdempotencyService, IdempotencyKeyReusedError, request_fingerprint
+from services.usage_services import AsyncUsageService
+from ..dependencies import get_current_user, idempotency_key
+from ..responses import FastJSONResponse, dump_json
+from database.database import AsyncReadSessionLocal, get_async_read_session, get_async_session
+from services.auth_services import UserPrincipal
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, next_cursor
+from typing import List, Optional
+from datetime import date, datetime
 
-router = APIRouter(prefix="/balance", tags=["balance"])
+router = APIRouter(prefix="/balance", tags=["balance"], default_response_class=FastJSONResponse)
 
 @router.get("/", response_model=BalanceResponse)
-def get_user_balance(
-    current_user: BaseUser = Depends(get_current_user),
-    db: Session = Depends(get_session)
+async def get_user_balance(
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
 ):
-    balance_service = BalanceService(db)
-    amount = balance_service.get_balance(current_user)
+    balance_service = AsyncBalanceService(db)
+    amount = await balance_service.get_balance(current_user)
     return {"amount": amount, "updated_at": datetime.utcnow()}
 
 @router.post("/deposit")
 async def deposit_balance(
     request: Request,
-    current_user: BaseUser = Depends(get_current_user),
-    db: Session = Depends(get_session)
+    current_user: UserPrincipal = Depends(get_current_user),
+    idem_key: Optional[str] = Depends(idempotency_key),
+    db: AsyncSession = Depends(get_async_session)
 ):
     form_data = await request.form()
+    idempotency = AsyncIdempotencyService(db)
+    request_hash = request_fingerprint("POST /balance/deposit", dict(form_data))
+    try:
+        if idem_key and await idempotency.lookup(current_user.user_id, idem_key, request_hash):
+            # Повтор: пополнение уже проведено
+            return RedirectResponse(url="/balance", status_code=303)
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     try:
         amount = Decimal(form_data.get("amount"))
         description = form_data.get("description", "")
         
-        balance_service = BalanceService(db)
-        transaction_id = balance_service.deposit(
+        balance_service = AsyncBalanceService(db)
+        transaction_id = await balance_service.deposit(
             user=current_user,
             amount=amount,
-            description=description
+            description=description,
+            commit=False
         )
+        body = {"transaction_id": transaction_id}
+        try:
+            # INSERT ключа выполняется сразу: конфликт PK возможен и здесь, и при commit
+            if idem_key:
+                await idempotency.store(current_user.user_id, idem_key, "POST /balance/deposit", request_hash, 303, body)
+            await db.commit()
+        except IntegrityError:
+            # Параллельный повтор с тем же ключом уже провёл пополнение
+            await db.rollback()
+            if not idem_key or not await idempotency.lookup(current_user.user_id, idem_key, request_hash):
+                raise
+        else:
+            forget_insufficient(current_user.user_id)
+            if idem_key:
+                idempotency.remember(current_user.user_id, idem_key, request_hash, 303, body)
         
         return RedirectResponse(url="/balance", status_code=303)
         
@@ -51,15 +82,52 @@ async def deposit_balance(
                 "request": request,
                 "current_user": current_user,
                 "error": str(e),
-                "transactions": BalanceService(db).get_transaction_history(current_user.user_id)
+                "transactions": await AsyncBalanceService(db).get_transaction_history(
+                    current_user.user_id, limit=DEFAULT_PAGE_SIZE
+                )
             },
             status_code=400
         )
 
+@router.get("/summary", response_model=UsageSummaryResponse)
+async def get_usage_summary(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_session)
+):
+    """Расходы по моделям и дням за период (по умолчанию последние 30 дней)"""
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    return await AsyncUsageService(db).get_summary(current_user.user_id, since, until)
+
 @router.get("/history", response_model=List[TransactionResponse])
-def get_transaction_history(
-    current_user: BaseUser = Depends(get_current_user),
-    db: Session = Depends(get_session)
+async def get_transaction_history(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_session)
+):
+    balance_service = AsyncBalanceService(db)
+    try:
+        transactions = await balance_service.get_transaction_history(
+            current_user.user_id, limit=limit, cursor=cursor
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    following = next_cursor(transactions, 'timestamp', 'id', limit)
+    # Записи сериализуются orjson напрямую, без проверки response_model
+    return FastJSONResponse(transactions, headers={"X-Next-Cursor": following} if following else None)
+
+@router.get("/history/export")
+async def export_transaction_history(
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    balance_service = BalanceService(db)
-    return balance_service.get_transaction_history(current_user.user_id)
\ No newline at end of file
+    """Вся история транзакций в формате NDJSON, построчно"""
+    async def rows():
+        async with AsyncReadSessionLocal() as session:
+            async for tx in AsyncBalanceService(session).stream_transaction_history(current_user.user_id):
+                yield dump_json(tx) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
\ No newline at end of file
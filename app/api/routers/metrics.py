@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..dependencies import get_current_user, token_matches
+from database.config import settings
+from database.database import get_async_session
+from ..middleware import profiler
+from models.base_user import UserRole
+from services.auth_services import UserPrincipal
+from services.metrics import registry
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+def require_admin(current_user: UserPrincipal = Depends(get_current_user)) -> UserPrincipal:
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin only")
+    return current_user
+
+async def require_metrics_access(request: Request, db: AsyncSession = Depends(get_async_session)) -> None:
+    """Prometheus с METRICS_TOKEN в Authorization: Bearer или администратор"""
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token_matches(credentials, settings.METRICS_TOKEN):
+        return
+    require_admin(await get_current_user(request, db))
+
+@router.get("", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+async def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling():
+    return {"sample_rate": profiler.sample_rate}
+
+@router.put("/profiling", dependencies=[Depends(require_admin)])
+async def set_profiling(sample_rate: int = Query(..., ge=0)):
+    """Профилировать 1 из sample_rate запросов; 0 - выключить"""
+    profiler.sample_rate = sample_rate
+    return {"sample_rate": profiler.sample_rate}
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles():
+    return profiler.recent()
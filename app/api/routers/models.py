@@ -1,12 +1,14 @@
+import asyncio
 import logging
 from typing import Dict, List
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..schemas import MLTaskResponse
 from database.database import get_session
 from models.model import MLTask, TaskStatus, MLTaskCreate
 from services.rmq.rm import rabbit_client
-from services.rmq.rpc import rpc_client
+from services.rmq.async_rpc import get_rpc_client
 from services.logging.logging import get_logger
 from services.model_services import MLTaskService
 
@@ -93,7 +95,7 @@ async def send_task_rpc(
     Returns:
         Dict[str, str]: Response message with original and processed text.
     """
-    
+    ml_task = None
     try:
         # Create task using service
         task_create = MLTaskCreate(
@@ -101,20 +103,28 @@ async def send_task_rpc(
             user_id=user_id,
             status=TaskStatus.NEW
         )
-        ml_task = mltask_service.create(task_create) 
+        # Сервис работает с синхронной сессией: её запросы выполняются в пуле потоков,
+        # чтобы не останавливать event loop
+        ml_task = await run_in_threadpool(mltask_service.create, task_create)
 
         logger.info(f"Sending RPC request with message: {message}")
-        result = rpc_client.call(text=message)
+        # Ожидание ответа не блокирует event loop: параллельные RPC-вызовы перекрываются
+        result = await get_rpc_client().call(text=message)
         logger.info(f"Received RPC response: {result}")
 
         # Update task with result using service
-        mltask_service.set_result(ml_task.id, result)
+        await run_in_threadpool(mltask_service.set_result, ml_task.id, result)
         
         return {"original": message, "processed": result}
+    except asyncio.TimeoutError:
+        logger.error(f"RPC call timed out for message: {message}")
+        if ml_task:
+            await run_in_threadpool(mltask_service.set_status, ml_task.id, TaskStatus.FAILED)
+        raise HTTPException(status_code=504, detail="RPC call timed out")
     except Exception as e:
         logger.error(f"Unexpected error in RPC call: {str(e)}")
         if ml_task:
-            mltask_service.set_status(ml_task.id, TaskStatus.FAILED)
+            await run_in_threadpool(mltask_service.set_status, ml_task.id, TaskStatus.FAILED)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @ml_route.get("/tasks", response_model=List[MLTaskResponse])  # Используем Pydantic схему
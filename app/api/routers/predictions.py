@@ -1,61 +1,275 @@
+import asyncio
+import json
+import logging
 from uuid import uuid4
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..schemas import PredictionCreate, PredictionResponse
-from services.prediction_history_services import PredictionService
-from services.balance_services import BalanceService
-from services.model_services import MLTaskService
-from ..dependencies import get_current_user
-from database.database import get_session
-from models.base_user import BaseUser
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..schemas import PredictionCreate, PredictionResponse, PredictionBatchCreate, PredictionBatchResponse, TaskResultIn
+from models.prediction_history import PredictionStatus
+from services.prediction_services import OPEN_STATUSES, AsyncPredictionService
+from services.balance_services import AsyncBalanceService
+from services.idempotency import AsyncIdempotencyService, IdempotencyKeyReusedError, request_fingerprint
+from services.model_services import AsyncModelService
+from services.scheduling import PriorityClass
+from services.prediction_cache import aget_model_info, cache_key, get_prediction_cache
+from services.task_events import build_task_event, get_task_event_hub, publish_task_events
+from database.config import settings
+from ..responses import FastJSONResponse, dump_json
+from ..dependencies import check_funds, get_current_user, idempotency_key, rate_limited_user, verify_worker_token
+from database.database import AsyncReadSessionLocal, get_async_read_session, get_async_session
+from services.auth_services import UserPrincipal
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, next_cursor
+from typing import List, Optional
 from decimal import Decimal
 
-router = APIRouter(prefix="/predictions", tags=["predictions"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/predictions", tags=["predictions"], default_response_class=FastJSONResponse)
 
 PREDICTION_COST = Decimal('10')
+MAX_BATCH_SIZE = 10000
+MAX_RESULTS_BATCH_SIZE = 10000
+LONG_POLL_TIMEOUT = 30
+MAX_LONG_POLL_TIMEOUT = 60
+SSE_KEEPALIVE_SECONDS = 15
+
+async def _replay(idempotency: AsyncIdempotencyService, user_id: str, key: str,
+                  request_hash: str) -> Optional[JSONResponse]:
+    """Сохранённый ответ на повтор запроса с тем же Idempotency-Key"""
+    try:
+        stored = await idempotency.lookup(user_id, key, request_hash)
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if stored is None:
+        return None
+    return JSONResponse(stored.response, status_code=stored.status_code,
+                        headers={"Idempotent-Replayed": "true"})
 
 @router.post("/", response_model=PredictionResponse)
-def create_prediction(
+async def create_prediction(
     prediction: PredictionCreate,
-    current_user: BaseUser = Depends(get_current_user),
-    db: Session = Depends(get_session)
+    current_user: UserPrincipal = Depends(rate_limited_user),
+    idem_key: Optional[str] = Depends(idempotency_key),
+    db: AsyncSession = Depends(get_async_session)
 ):
-    prediction_service = PredictionService(db)
-    balance_service = BalanceService(db)
-    model_service = MLTaskService(db)
+    idempotency = AsyncIdempotencyService(db)
+    request_hash = request_fingerprint("POST /predictions/", prediction.model_dump())
+    if idem_key:
+        replay = await _replay(idempotency, current_user.user_id, idem_key, request_hash)
+        if replay is not None:
+            return replay
+
+    check_funds(current_user, PREDICTION_COST)
+    prediction_service = AsyncPredictionService(db)
+    balance_service = AsyncBalanceService(db)
+    model_service = AsyncModelService(db)
     
     try:
-        # Списание средств
-        balance_service.withdraw(
+        # Такой же вход уже считался этой версией модели - отвечаем сразу, без брокера
+        key = None
+        if settings.PREDICTION_CACHE_ENABLED:
+            model_info = await aget_model_info(db, prediction.model_id)
+            if model_info is not None:
+                key = cache_key(prediction.model_id, *model_info, prediction.input_data)
+        cached = await get_prediction_cache().aget(key) if key else None
+
+        # Списание, задача и сообщение для брокера - одна транзакция и один commit
+        task_id = str(uuid4())
+        await balance_service.withdraw(
             current_user.user_id,
             PREDICTION_COST,
-            f"Prediction using model {prediction.model_id}"
+            f"Prediction using model {prediction.model_id}",
+            commit=False,
+            model_id=prediction.model_id
         )
-        
-        # Публикация задачи в RabbitMQ
-        task_id = model_service.publish_prediction_task(
-            prediction.model_id,
-            prediction.input_data
-        )
-        
-        # Создание записи о задаче
-        task = prediction_service.create_task({
+        task_data = {
             'task_id': task_id,
             'user_id': current_user.user_id,
             'model_id': prediction.model_id,
-            'input_data': prediction.input_data,
-            'status': 'queued'
-        })
-        
-        return task
+            'input_data': prediction.input_data
+        }
+        if cached is not None:
+            task = await prediction_service.create_completed_task(task_data, cached, commit=False)
+        else:
+            task = await prediction_service.create_task(task_data, commit=False)
+            await model_service.enqueue_prediction_tasks(
+                prediction.model_id,
+                [(task_id, prediction.input_data)],
+                current_user.user_id
+            )
+
+        body = None
+        if idem_key:
+            await db.flush()
+            body = PredictionResponse.model_validate(task).model_dump(mode="json")
+            await idempotency.store(current_user.user_id, idem_key, "POST /predictions/", request_hash, 200, body)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        # Параллельный повтор с тем же ключом успел первым - его ответ и отдаём
+        replay = await _replay(idempotency, current_user.user_id, idem_key, request_hash) if idem_key else None
+        if replay is None:
+            raise HTTPException(status_code=400, detail=str(e))
+        return replay
     except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if idem_key:
+        idempotency.remember(current_user.user_id, idem_key, request_hash, 200, body)
+    return task
+
+@router.post("/batch", response_model=PredictionBatchResponse)
+async def create_prediction_batch(
+    batch: PredictionBatchCreate,
+    current_user: UserPrincipal = Depends(rate_limited_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    if not batch.inputs:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(batch.inputs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch size exceeds {MAX_BATCH_SIZE}")
+    check_funds(current_user, PREDICTION_COST * len(batch.inputs))
+
+    prediction_service = AsyncPredictionService(db)
+    balance_service = AsyncBalanceService(db)
+    model_service = AsyncModelService(db)
+    tasks = [(str(uuid4()), input_data) for input_data in batch.inputs]
+
+    try:
+        # Одно списание на весь батч и одна вставка всех задач в общей транзакции
+        transaction_id = await balance_service.withdraw(
+            current_user.user_id,
+            PREDICTION_COST * len(tasks),
+            f"Batch of {len(tasks)} predictions using model {batch.model_id}",
+            commit=False,
+            model_id=batch.model_id,
+            count=len(tasks)
+        )
+        await prediction_service.create_tasks(current_user.user_id, batch.model_id, tasks, commit=False,
+                                              priority=PriorityClass.BULK)
+        await model_service.enqueue_prediction_tasks(
+            batch.model_id, tasks, current_user.user_id, priority=PriorityClass.BULK
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        'model_id': batch.model_id,
+        'task_ids': [task_id for task_id, _ in tasks],
+        'transaction_id': transaction_id
+    }
+
+@router.post("/results/bulk", dependencies=[Depends(verify_worker_token)])
+async def ingest_results_bulk(
+    results: List[TaskResultIn],
+    db: AsyncSession = Depends(get_async_session)
+):
+    """
+    Приём результатов пачки задач от воркера; повторная отправка безопасна.
+    События завершения публикуются после commit только для задач, которые
+    этот запрос завершил.
+    """
+    if len(results) > MAX_RESULTS_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch size exceeds {MAX_RESULTS_BATCH_SIZE}")
+    try:
+        applied = await AsyncPredictionService(db).set_results_bulk([item.model_dump() for item in results])
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    events = [
+        build_task_event(item['task_id'], user_id, PredictionStatus(item['status']).value,
+                         result=item['result'], error=item['error'])
+        for item, user_id in applied
+    ]
+    try:
+        await publish_task_events(events)
+    except Exception:
+        # Результаты уже сохранены: long-poll увидит их в БД при следующем запросе
+        logger.exception("Failed to publish %d task events", len(events))
+    return {"received": len(results)}
 
 @router.get("/history", response_model=List[PredictionResponse])
-def get_prediction_history(
-    current_user: BaseUser = Depends(get_current_user),
-    db: Session = Depends(get_session)
+async def get_prediction_history(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_session)
+):
+    prediction_service = AsyncPredictionService(db)
+    try:
+        tasks = await prediction_service.get_user_history(current_user, limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Курсор следующей страницы передаём в заголовке, формат ответа не меняется
+    following = next_cursor(tasks, 'created_at', 'task_id', limit)
+    # Записи сериализуются orjson напрямую, без проверки response_model
+    return FastJSONResponse(tasks, headers={"X-Next-Cursor": following} if following else None)
+
+@router.get("/history/export")
+async def export_prediction_history(
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    prediction_service = PredictionService(db)
-    return prediction_service.get_user_history(current_user)
\ No newline at end of file
+    """Вся история предсказаний в формате NDJSON, построчно"""
+    async def rows():
+        # Своя сессия: сессия зависимости закрывается до окончания стриминга
+        async with AsyncReadSessionLocal() as session:
+            async for task in AsyncPredictionService(session).stream_user_history(current_user.user_id):
+                yield dump_json(task) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+@router.get("/events")
+async def prediction_events(
+    request: Request,
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Server-Sent Events: завершение задач текущего пользователя"""
+    hub = await get_task_event_hub()
+
+    async def stream():
+        async with hub.subscription(user_id=current_user.user_id) as queue:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE не даёт прокси закрыть простаивающее соединение
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['status']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{task_id}/wait", response_model=PredictionResponse)
+async def wait_for_prediction(
+    task_id: str,
+    timeout: float = Query(LONG_POLL_TIMEOUT, gt=0, le=MAX_LONG_POLL_TIMEOUT),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Long-poll: ответ приходит при завершении задачи или по истечении timeout"""
+    hub = await get_task_event_hub()
+    prediction_service = AsyncPredictionService(db)
+
+    # Подписка до чтения из БД, чтобы не пропустить событие между ними
+    async with hub.subscription(task_id=task_id) as queue:
+        task = await prediction_service.get_task(task_id)
+        if task is None or task.user_id != current_user.user_id:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task.status not in OPEN_STATUSES:
+            return task
+        try:
+            await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return task
+
+    await db.refresh(task)
+    return task
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..schemas import UserCreate, UserResponse
-from services.base_user_services import UserService
-from database.database import get_session
+from services.base_user_services import AsyncUserService
+from services.password_hasher import HasherSaturatedError
+from database.database import get_async_session
 from uuid import uuid4
 
 router = APIRouter(prefix="/users")
@@ -11,7 +12,7 @@ router = APIRouter(prefix="/users")
 @router.post("/", response_model=UserResponse)
 async def create_user(
     request: Request,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     form_data = await request.form()
     try:
@@ -26,8 +27,8 @@ async def create_user(
         if user_data['password'] != user_data['password_confirm']:
             raise HTTPException(status_code=400, detail="Пароли не совпадают")
         
-        user_service = UserService(db)
-        db_user = user_service.create_user({
+        user_service = AsyncUserService(db)
+        db_user = await user_service.create_user({
             'username': user_data['username'],
             'email': user_data['email'],
             'password': user_data['password']
@@ -36,5 +37,11 @@ async def create_user(
         # Перенаправление после успешной регистрации
         return RedirectResponse(url="/login", status_code=303)
         
+    except HasherSaturatedError:
+        raise HTTPException(
+            status_code=429,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"}
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr, ConfigDict, SecretStr
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 from decimal import Decimal
 
 # Auth schemas
@@ -63,6 +63,28 @@ class BalanceResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class UsageTotal(BaseModel):
+    type: TransactionType
+    amount: Decimal
+    count: int
+
+class ModelUsage(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_id: str
+    amount: Decimal
+    count: int
+
+class DailyUsage(UsageTotal):
+    day: date
+
+class UsageSummaryResponse(BaseModel):
+    since: date
+    until: date
+    totals: List[UsageTotal]
+    by_model: List[ModelUsage]
+    by_day: List[DailyUsage]
+
 # Model schemas
 class TaskStatus(str, Enum):
     """Дублируем enum для статусов, если он нужен в схемах"""
@@ -100,6 +122,7 @@ class MLTaskResponse(BaseModel):
 # Prediction schemas
 class PredictionStatus(str, Enum):
     PENDING = "pending"
+    PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
 
@@ -109,6 +132,26 @@ class PredictionCreate(BaseModel):
     model_id: str
     input_data: dict
 
+class PredictionBatchCreate(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_id: str
+    inputs: List[dict]
+
+class PredictionBatchResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_id: str
+    task_ids: List[str]
+    transaction_id: str
+
+class TaskResultIn(BaseModel):
+    """Результат задачи, присланный воркером"""
+    task_id: str
+    status: PredictionStatus
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
 class PredictionResponse(PredictionCreate):
     task_id: str
     user_id: str
@@ -0,0 +1,3 @@
+from services_alias import register_services
+
+register_services()
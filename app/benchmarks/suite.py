@@ -0,0 +1,319 @@
+"""
+Бенчмарк основных эндпоинтов и воркера на локальных заменителях.
+
+Приложение FastAPI собирается в процессе из настоящих роутеров и
+вызывается через httpx.ASGITransport, без сети. База - временный файл
+SQLite (aiosqlite) или --url со схемой из миграций, брокер -
+InMemoryBroker, модель - заглушка. Для каждого сценария выводятся req/s, p50/p95/p99 и среднее
+число SQL-запросов на запрос.
+
+Сценарии:
+    auth.login          - POST /auth/login: проверка пароля и токен в cookie
+    balance.get         - GET /balance/
+    predictions.create  - POST /predictions/
+    predictions.history - GET /predictions/history
+    worker.batch        - релей outbox -> InMemoryBroker -> MLWorker.process_batch
+
+Запуск (из каталога app):
+    python -m benchmarks.suite --requests 500 --concurrency 8
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.2
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+
+benchmarks/baseline.json снят с параметрами по умолчанию на временном
+SQLite. Время зависит от машины: на другой машине сначала снимают свой
+базовый файл, а число SQL-запросов на запрос сравнимо везде. После
+намеренного изменения производительности базовый файл обновляют
+через --save-baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, List
+
+# Модели импортируют database.database, которому нужны настройки БД
+for _key, _value in {"DB_HOST": "localhost", "DB_PORT": "5432", "DB_USER": "user",
+                     "DB_PASS": "password", "DB_NAME": "mydb"}.items():
+    os.environ.setdefault(_key, _value)
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import models  # noqa: F401  регистрирует все таблицы в Base.metadata
+from database.config import settings
+from database.database import Base, get_async_read_session, get_async_session, run_migrations
+from models.model import BaseMLModel
+from services.auth_services import AuthService
+from services.balance_services import AsyncBalanceService
+from services.base_user_services import AsyncUserService
+from services.metrics import RequestStats, instrument_engine, request_stats
+from services.ml_worker import MLWorker
+from services.model_registry import ModelRegistry
+from services.outbox_relay import OutboxRelay
+from services.rmq.memory import InMemoryBroker, InMemoryPublisher
+from services.rmq.publisher import set_publisher
+from services.scheduling import PriorityClass, queue_name
+
+PASSWORD = "benchmark-password"
+MODEL_ID = "bench_model"
+
+class StubModel:
+    """Заглушка TensorFlowModelService: постоянное время на батч"""
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    def predict_batch(self, inputs: List[Dict]) -> List[Dict]:
+        return [{'prediction': sum(len(str(v)) for v in item.values())} for item in inputs]
+
+def _sync_url(url: str) -> str:
+    return url.replace("+aiosqlite", "").replace("+asyncpg", "+psycopg2")
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+def _summary(name: str, latencies: List[float], queries: List[int], elapsed: float, errors: int) -> Dict:
+    return {
+        'scenario': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'queries_per_request': statistics.mean(queries) if queries else 0.0
+    }
+
+class Bench:
+    def __init__(self, url: str, users: int):
+        self.url = url
+        self.users = [f"bench_user_{i}" for i in range(users)]
+        self.engine = create_async_engine(url, connect_args={"timeout": 60} if url.startswith("sqlite") else {})
+        instrument_engine(self.engine.sync_engine, "benchmark")
+        self.session_factory = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False,
+                                                  class_=AsyncSession)
+        self.broker = InMemoryBroker()
+        set_publisher(InMemoryPublisher(self.broker))
+        self.app = self._build_app()
+        self.tokens: Dict[str, str] = {}
+
+    def _build_app(self) -> FastAPI:
+        from api.routers import auth, balance, predictions
+
+        app = FastAPI()
+        app.include_router(auth.router)
+        app.include_router(balance.router)
+        app.include_router(predictions.router)
+
+        async def session():
+            async with self.session_factory() as db:
+                yield db
+
+        app.dependency_overrides[get_async_session] = session
+        app.dependency_overrides[get_async_read_session] = session
+        return app
+
+    async def setup(self) -> None:
+        async with self.engine.begin() as conn:
+            # --url может указывать на базу прошлого запуска
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+            await conn.run_sync(run_migrations)
+        async with self.session_factory() as db:
+            for user_id in self.users:
+                user = await AsyncUserService(db).create_user({
+                    'user_id': user_id,
+                    'username': user_id,
+                    'email': f"{user_id}@example.com",
+                    'password': PASSWORD
+                })
+                await AsyncBalanceService(db).deposit(user, Decimal("1000000"), "benchmark")
+                self.tokens[user_id] = AuthService.create_access_token(AuthService.token_claims(user))
+            db.add(BaseMLModel(model_id=MODEL_ID, name=MODEL_ID, owner_id=self.users[0], model_type="stub"))
+            await db.commit()
+
+    async def run_http(self, name: str, call: Callable[[httpx.AsyncClient, str, int], Awaitable[httpx.Response]],
+                       requests: int, concurrency: int) -> Dict:
+        latencies: List[float] = []
+        queries: List[int] = []
+        errors = 0
+        transport = httpx.ASGITransport(app=self.app)
+
+        async def client_loop(worker: int):
+            nonlocal errors
+            user_id = self.users[worker % len(self.users)]
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for i in range(worker, requests, concurrency):
+                    stats = RequestStats()
+                    token = request_stats.set(stats)
+                    started = time.perf_counter()
+                    try:
+                        response = await call(client, user_id, i)
+                    finally:
+                        request_stats.reset(token)
+                    latencies.append(time.perf_counter() - started)
+                    queries.append(stats.queries)
+                    if response.status_code >= 400:
+                        errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(worker) for worker in range(concurrency)))
+        return _summary(name, latencies, queries, time.perf_counter() - started, errors)
+
+    def _auth(self, user_id: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+    async def login(self, client, user_id, i):
+        return await client.post("/auth/login", data={"username": user_id, "password": PASSWORD})
+
+    async def get_balance(self, client, user_id, i):
+        return await client.get("/balance/", headers=self._auth(user_id))
+
+    async def create_prediction(self, client, user_id, i):
+        return await client.post("/predictions/", headers=self._auth(user_id),
+                                 json={"model_id": MODEL_ID, "input_data": {"x": i, "user": user_id}})
+
+    async def prediction_history(self, client, user_id, i):
+        return await client.get("/predictions/history", params={"limit": 50}, headers=self._auth(user_id))
+
+    async def run_worker(self, batch_size: int) -> Dict:
+        """Релей outbox в брокер и обработка всех задач воркером по батчам"""
+        relay = OutboxRelay(self.session_factory, InMemoryPublisher(self.broker), poll_interval=0)
+        while await relay.relay_once():
+            pass
+
+        sync_engine = create_engine(_sync_url(self.url))
+        instrument_engine(sync_engine, "benchmark_sync")
+        worker = MLWorker(
+            session_factory=sessionmaker(bind=sync_engine, autoflush=False),
+            registry=ModelRegistry(loader=StubModel, size_of=lambda path: 0),
+            cache=None
+        )
+        routing_key = queue_name(PriorityClass.INTERACTIVE, MODEL_ID)
+        latencies: List[float] = []
+        queries: List[int] = []
+        processed = 0
+        started = time.perf_counter()
+        while self.broker.depth(routing_key):
+            messages = []
+            while len(messages) < batch_size and self.broker.depth(routing_key):
+                messages.append(self.broker.get(routing_key))
+            stats = RequestStats()
+            token = request_stats.set(stats)
+            batch_started = time.perf_counter()
+            try:
+                worker.process_batch(MODEL_ID, messages)
+            finally:
+                request_stats.reset(token)
+            latencies.append(time.perf_counter() - batch_started)
+            queries.append(stats.queries)
+            processed += len(messages)
+        elapsed = time.perf_counter() - started
+        sync_engine.dispose()
+
+        summary = _summary("worker.batch", latencies, queries, elapsed, 0)
+        # Для воркера пропускная способность - задачи, а не батчи
+        summary['requests'] = processed
+        summary['rps'] = processed / elapsed if elapsed else 0.0
+        return summary
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+
+def compare(results: List[Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Регрессии: req/s ниже или p95 выше базового больше чем на threshold, больше SQL на запрос"""
+    problems = []
+    for result in results:
+        base = baseline.get(result['scenario'])
+        if base is None:
+            continue
+        name = result['scenario']
+        if result['rps'] < base['rps'] * (1 - threshold):
+            problems.append(f"{name}: {result['rps']:.0f} req/s vs baseline {base['rps']:.0f}")
+        if result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            problems.append(f"{name}: p95 {result['p95_ms']:.1f}ms vs baseline {base['p95_ms']:.1f}ms")
+        if result['queries_per_request'] > base['queries_per_request'] + 0.01:
+            problems.append(f"{name}: {result['queries_per_request']:.2f} queries/request "
+                            f"vs baseline {base['queries_per_request']:.2f}")
+    return problems
+
+def print_table(results: List[Dict]) -> None:
+    print(f"{'scenario':<22}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for r in results:
+        print(f"{r['scenario']:<22}{r['requests']:>9}{r['errors']:>8}{r['rps']:>10.0f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['queries_per_request']:>9.2f}")
+
+async def run(args) -> List[Dict]:
+    settings.RATE_LIMIT_ENABLED = False
+    bench = Bench(args.url, args.users)
+    try:
+        await bench.setup()
+        results = []
+        scenarios = [
+            ("auth.login", bench.login, args.login_requests),
+            ("balance.get", bench.get_balance, args.requests),
+            ("predictions.create", bench.create_prediction, args.requests),
+            ("predictions.history", bench.prediction_history, args.requests),
+        ]
+        for name, call, requests in scenarios:
+            if args.only and name not in args.only:
+                continue
+            results.append(await bench.run_http(name, call, requests, args.concurrency))
+        if not args.only or "worker.batch" in args.only:
+            results.append(await bench.run_worker(settings.WORKER_BATCH_SIZE))
+        return results
+    finally:
+        await bench.close()
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="Async URL базы данных (по умолчанию временный файл SQLite)")
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    parser.add_argument("--login-requests", type=int, default=50, help="Запросов входа (bcrypt дорогой)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--bcrypt-rounds", type=int, default=None,
+                        help="Cost-фактор bcrypt (по умолчанию BCRYPT_ROUNDS)")
+    parser.add_argument("--only", nargs="*", help="Запустить только указанные сценарии")
+    parser.add_argument("--baseline", help="JSON с базовыми результатами для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое ухудшение, доля")
+    parser.add_argument("--save-baseline", help="Сохранить результаты как базовые")
+    parser.add_argument("--json", action="store_true", help="Вывести результаты в JSON")
+    args = parser.parse_args()
+
+    args.url = args.url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    if args.bcrypt_rounds is not None:
+        settings.BCRYPT_ROUNDS = args.bcrypt_rounds
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({r['scenario']: r for r in results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.threshold)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            return 1
+        print("OK: within threshold of baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Окружение Alembic: схема - Base.metadata всех моделей, URL - из настроек.
+
+init_db передаёт открытое соединение через config.attributes["connection"],
+тогда миграции идут в его транзакции, а логирование приложения не
+перенастраивается.
+"""
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine, pool
+import models  # noqa: F401  регистрирует все таблицы в Base.metadata
+from database.config import settings
+from database.database import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+def _configure(**kwargs) -> None:
+    context.configure(target_metadata=target_metadata, compare_type=True, **kwargs)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_offline() -> None:
+    """SQL-скрипт без подключения: alembic upgrade head --sql"""
+    _configure(url=settings.DATABASE_URL_psycopg2, literal_binds=True, dialect_opts={"paramstyle": "named"})
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _configure(connection=connection, render_as_batch=connection.dialect.name == "sqlite")
+        return
+
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    engine = create_engine(settings.DATABASE_URL_psycopg2, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        _configure(connection=connection, render_as_batch=connection.dialect.name == "sqlite")
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,89 @@
+"""initial schema
+
+Схема, которую до миграций создавал init_db через create_all, в том виде,
+в каком она была до первых изменений моделей. Базы, созданные так,
+run_migrations досоздаёт до ревизии 0002 и помечает ею
+(database.database.repair_legacy_schema).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 03:42:33.939596
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+ENUM_NAMES = ('userrole', 'mlmodelstatus', 'transactiontype', 'transactionstatus', 'predictionstatus')
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('password', sa.String(), nullable=False),
+    sa.Column('password_hash', sa.String(), nullable=False),
+    sa.Column('role', sa.Enum('ADMIN', 'REGULAR', 'MODEL_OWNER', name='userrole'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('balances',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('models',
+    sa.Column('model_id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('owner_id', sa.String(), nullable=False),
+    sa.Column('status', sa.Enum('TRAINING', 'ACTIVE', 'INACTIVE', 'ERROR', name='mlmodelstatus'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('model_metadata', sa.JSON(), nullable=True),
+    sa.Column('model_type', sa.String(), nullable=False),
+    sa.Column('model_path', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('model_id')
+    )
+    op.create_table('transactions',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.Column('type', sa.Enum('DEPOSIT', 'WITHDRAWAL', 'PAYMENT', 'REFUND', name='transactiontype'), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'COMPLETED', 'FAILED', 'REVERSED', name='transactionstatus'), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('predictions',
+    sa.Column('task_id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=True),
+    sa.Column('model_id', sa.String(), nullable=True),
+    sa.Column('input_data', sa.JSON(), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'COMPLETED', 'FAILED', name='predictionstatus'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['model_id'], ['models.model_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('task_id')
+    )
+
+def downgrade() -> None:
+    op.drop_table('predictions')
+    op.drop_table('transactions')
+    op.drop_table('models')
+    op.drop_table('balances')
+    op.drop_table('users')
+    # drop_table не удаляет типы ENUM PostgreSQL
+    for name in ENUM_NAMES:
+        sa.Enum(name=name).drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,140 @@
+"""schema before alembic
+
+Изменения моделей, сделанные до перехода на Alembic: в базу они попадали
+только через create_all на пустой базе. Версия модели, поля heartbeat
+задач и статус processing, таблицы usage_daily, idempotency_keys и
+outbox, индексы истории, heartbeat, сводки и очистки.
+
+Ревизия выполняет все шаги STEPS без проверок. База, созданная
+create_all уже после части этих изменений, до неё не доходит:
+database.database.repair_legacy_schema выполняет только шаги,
+объектов которых в ней нет, и помечает её 0002.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 03:42:50.105311
+"""
+from typing import Callable, Dict, List
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+OLD_PREDICTION_STATUS = sa.Enum('PENDING', 'COMPLETED', 'FAILED', name='predictionstatus')
+PREDICTION_STATUS = sa.Enum('PENDING', 'PROCESSING', 'COMPLETED', 'FAILED', name='predictionstatus')
+
+# (имя, таблица, колонки, параметры)
+INDEXES = (
+    ('ix_transactions_user_id_timestamp', 'transactions', ['user_id', 'timestamp'], {}),
+    ('ix_predictions_user_id_created_at', 'predictions', ['user_id', 'created_at'], {}),
+    ('ix_predictions_model_id_created_at', 'predictions', ['model_id', 'created_at'], {}),
+    ('ix_predictions_status_heartbeat_at', 'predictions', ['status', 'heartbeat_at'], {}),
+    ('ix_usage_daily_user_id_day', 'usage_daily', ['user_id', 'day'], {}),
+    ('ix_idempotency_keys_created_at', 'idempotency_keys', ['created_at'], {}),
+    ('ix_outbox_unsent', 'outbox', ['id'],
+     {'postgresql_where': sa.text('sent_at IS NULL'), 'sqlite_where': sa.text('sent_at IS NULL')}),
+)
+
+def _predictionstatus_processing() -> None:
+    if op.get_context().dialect.name == 'postgresql':
+        # В транзакции допустимо с PostgreSQL 12; значение не используется до commit
+        op.execute("ALTER TYPE predictionstatus ADD VALUE IF NOT EXISTS 'PROCESSING' AFTER 'PENDING'")
+    else:
+        # Без нативного ENUM статус - VARCHAR по длине самого длинного имени
+        with op.batch_alter_table('predictions') as batch_op:
+            batch_op.alter_column('status', existing_type=OLD_PREDICTION_STATUS, type_=PREDICTION_STATUS,
+                                  existing_nullable=True)
+
+def _add_column(table: str, column: Callable[[], sa.Column]) -> Callable[[], None]:
+    return lambda: op.add_column(table, column())
+
+def _create_usage_daily() -> None:
+    op.create_table('usage_daily',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('model_id', sa.String(), nullable=False),
+    # Тип transactiontype уже создан вместе с transactions
+    sa.Column('type', postgresql.ENUM('DEPOSIT', 'WITHDRAWAL', 'PAYMENT', 'REFUND',
+                                      name='transactiontype', create_type=False), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'model_id', 'type')
+    )
+
+def _create_idempotency_keys() -> None:
+    op.create_table('idempotency_keys',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('endpoint', sa.String(), nullable=False),
+    sa.Column('request_hash', sa.String(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=False),
+    sa.Column('response', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'key')
+    )
+
+def _create_outbox() -> None:
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('routing_key', sa.String(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+def _create_index(name: str, table: str, columns: List[str], kwargs: Dict) -> Callable[[], None]:
+    return lambda: op.create_index(name, table, columns, unique=False, **kwargs)
+
+# (объект, который создаёт шаг, шаг). Объект - ('column', таблица, колонка),
+# ('table', таблица) или ('index', таблица, индекс); None - идемпотентный шаг,
+# выполняется всегда.
+# По объектам database.database.repair_legacy_schema пропускает то, что уже есть.
+STEPS = (
+    (None, _predictionstatus_processing),
+    (('column', 'models', 'version'),
+     _add_column('models', lambda: sa.Column('version', sa.Integer(), server_default='1', nullable=False))),
+    (('column', 'predictions', 'worker_id'),
+     _add_column('predictions', lambda: sa.Column('worker_id', sa.String(), nullable=True))),
+    (('column', 'predictions', 'heartbeat_at'),
+     _add_column('predictions', lambda: sa.Column('heartbeat_at', sa.DateTime(), nullable=True))),
+    (('column', 'predictions', 'attempts'),
+     _add_column('predictions', lambda: sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))),
+    (('table', 'usage_daily'), _create_usage_daily),
+    (('table', 'idempotency_keys'), _create_idempotency_keys),
+    (('table', 'outbox'), _create_outbox),
+) + tuple(
+    (('index', table, name), _create_index(name, table, columns, kwargs))
+    for name, table, columns, kwargs in INDEXES
+)
+
+def upgrade() -> None:
+    for _, step in STEPS:
+        step()
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_table('outbox')
+    op.drop_table('idempotency_keys')
+    op.drop_table('usage_daily')
+    with op.batch_alter_table('predictions') as batch_op:
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('worker_id')
+    with op.batch_alter_table('models') as batch_op:
+        batch_op.drop_column('version')
+    # Значение PROCESSING из типа PostgreSQL не удалить: задачи возвращаются в очередь
+    op.execute("UPDATE predictions SET status = 'PENDING' WHERE status = 'PROCESSING'")
+    if op.get_context().dialect.name != 'postgresql':
+        with op.batch_alter_table('predictions') as batch_op:
+            batch_op.alter_column('status', existing_type=PREDICTION_STATUS, type_=OLD_PREDICTION_STATUS,
+                                  existing_nullable=True)
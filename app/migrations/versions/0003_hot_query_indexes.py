@@ -0,0 +1,33 @@
+"""hot query indexes
+
+Вход без учёта регистра по lower(email) / lower(username), модели
+владельца и CHECK на неотрицательный баланс. Уникальные индексы не
+создадутся, если в users уже есть email или username, отличающиеся
+только регистром: такие записи нужно объединить до миграции.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 03:43:00.447727
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')], unique=True)
+    op.create_index('ix_users_lower_username', 'users', [sa.text('lower(username)')], unique=True)
+    op.create_index('ix_models_owner_id', 'models', ['owner_id'], unique=False)
+    # batch: SQLite добавляет ограничения только пересозданием таблицы
+    with op.batch_alter_table('balances') as batch_op:
+        batch_op.create_check_constraint('ck_balances_amount_non_negative', 'amount >= 0')
+
+def downgrade() -> None:
+    with op.batch_alter_table('balances') as batch_op:
+        batch_op.drop_constraint('ck_balances_amount_non_negative', type_='check')
+    op.drop_index('ix_models_owner_id', table_name='models')
+    op.drop_index('ix_users_lower_username', table_name='users')
+    op.drop_index('ix_users_lower_email', table_name='users')
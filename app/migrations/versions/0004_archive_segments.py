@@ -0,0 +1,35 @@
+"""archive segments
+
+Учёт файлов архивной истории (services.history_archiver).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 04:05:12.118204
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('archive_segments',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('period', sa.String(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('min_ts', sa.DateTime(), nullable=False),
+    sa.Column('max_ts', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archive_segments_user_id_kind_max_ts', 'archive_segments',
+                    ['user_id', 'kind', 'max_ts'], unique=False)
+
+def downgrade() -> None:
+    op.drop_table('archive_segments')
@@ -0,0 +1,36 @@
+"""keyset pagination indexes
+
+Индексы истории включают весь ключ курсора (время, id): условие
+(ts, id) < (:ts, :id) и ORDER BY ts DESC, id DESC читаются одним
+диапазоном индекса без сортировки. Старые индексы без id заменяются.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 06:12:41.530117
+"""
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# (старый индекс, новый индекс, таблица, колонки нового)
+INDEXES = (
+    ('ix_transactions_user_id_timestamp', 'ix_transactions_user_id_timestamp_id',
+     'transactions', ['user_id', 'timestamp', 'id']),
+    ('ix_predictions_user_id_created_at', 'ix_predictions_user_id_created_at_task_id',
+     'predictions', ['user_id', 'created_at', 'task_id']),
+    ('ix_predictions_model_id_created_at', 'ix_predictions_model_id_created_at_task_id',
+     'predictions', ['model_id', 'created_at', 'task_id']),
+)
+
+def upgrade() -> None:
+    for old, new, table, columns in INDEXES:
+        op.create_index(new, table, columns, unique=False)
+        op.drop_index(old, table_name=table)
+
+def downgrade() -> None:
+    for old, new, table, columns in INDEXES:
+        op.create_index(old, table, columns[:2], unique=False)
+        op.drop_index(new, table_name=table)
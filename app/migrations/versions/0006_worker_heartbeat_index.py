@@ -0,0 +1,22 @@
+"""worker heartbeat index
+
+Heartbeat воркера обновляет его задачи в processing (worker_id, status);
+по ix_predictions_status_heartbeat_at это поиск только по status с
+фильтрацией задач всех воркеров.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 06:48:19.204663
+"""
+from alembic import op
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_predictions_worker_id_status', 'predictions', ['worker_id', 'status'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_predictions_worker_id_status', table_name='predictions')
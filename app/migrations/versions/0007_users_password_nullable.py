@@ -0,0 +1,41 @@
+"""users password nullable
+
+Устаревшая колонка users.password: пароль хранится только как
+password_hash, и create_user её не заполняет, поэтому NOT NULL
+делал регистрацию невозможной.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 08:05:37.661249
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+# Индексы по выражению batch-режим SQLite не переносит в новую таблицу
+EXPRESSION_INDEXES = (
+    ('ix_users_lower_email', 'lower(email)'),
+    ('ix_users_lower_username', 'lower(username)'),
+)
+
+def _alter_password(nullable: bool) -> None:
+    recreate = op.get_context().dialect.name != 'postgresql'
+    if recreate:
+        for name, _ in EXPRESSION_INDEXES:
+            op.drop_index(name, table_name='users')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(), nullable=nullable)
+    if recreate:
+        for name, expression in EXPRESSION_INDEXES:
+            op.create_index(name, 'users', [sa.text(expression)], unique=True)
+
+def upgrade() -> None:
+    _alter_password(nullable=True)
+
+def downgrade() -> None:
+    op.execute("UPDATE users SET password = '' WHERE password IS NULL")
+    _alter_password(nullable=False)
@@ -0,0 +1,24 @@
+"""prediction priority
+
+Класс приоритета задачи (services.scheduling.PriorityClass): reaper
+возвращает зависшую задачу в очередь её класса, а не всегда в
+интерактивную. Существующие задачи считаются интерактивными.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 09:21:48.730512
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('predictions', sa.Column('priority', sa.String(), server_default='interactive', nullable=False))
+
+def downgrade() -> None:
+    with op.batch_alter_table('predictions') as batch_op:
+        batch_op.drop_column('priority')
@@ -2,5 +2,9 @@ from .base_user import BaseUser
 from .model import BaseMLModel
 from .balance import Balance, Transaction
 from .prediction_history import PredictionTask
+from .outbox import OutboxMessage
+from .usage import UsageDaily
+from .idempotency import IdempotencyKey
+from .archive import ArchiveSegment
 
-__all__ = ['BaseUser', 'BaseMLModel', 'Balance', 'Transaction', 'PredictionTask']
\ No newline at end of file
+__all__ = ['BaseUser', 'BaseMLModel', 'Balance', 'Transaction', 'PredictionTask', 'OutboxMessage', 'UsageDaily', 'IdempotencyKey', 'ArchiveSegment']
\ No newline at end of file
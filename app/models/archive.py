@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, String, ForeignKey, Index
+from database.database import Base
+
+class ArchiveSegment(Base):
+    """Файл JSONL.gz с архивной историей одного пользователя за месяц"""
+    __tablename__ = "archive_segments"
+    __table_args__ = (
+        # Сегменты пользователя от новых к старым для чтения истории
+        Index("ix_archive_segments_user_id_kind_max_ts", "user_id", "kind", "max_ts"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)  # predictions | transactions
+    user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
+    period = Column(String, nullable=False)  # YYYY-MM
+    path = Column(String, nullable=False)  # относительно ARCHIVE_DIR
+    rows = Column(Integer, nullable=False)
+    min_ts = Column(DateTime, nullable=False)
+    max_ts = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
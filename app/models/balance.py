@@ -2,7 +2,7 @@ from decimal import Decimal
 from enum import Enum
 from uuid import uuid4
 from datetime import datetime
-from sqlalchemy import Column, String, Numeric, Enum as SQLEnum, DateTime, ForeignKey
+from sqlalchemy import CheckConstraint, Column, String, Numeric, Enum as SQLEnum, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database.database import Base
 
@@ -20,6 +20,10 @@ class TransactionStatus(str, Enum):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Keyset-пагинация истории транзакций пользователя: весь ключ курсора в индексе
+        Index("ix_transactions_user_id_timestamp_id", "user_id", "timestamp", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: f"tx_{uuid4().hex}")
     user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
@@ -34,6 +38,10 @@ class Transaction(Base):
 
 class Balance(Base):
     __tablename__ = "balances"
+    __table_args__ = (
+        # Последний рубеж: условное списание в ledger не должно уводить баланс в минус
+        CheckConstraint("amount >= 0", name="ck_balances_amount_non_negative"),
+    )
 
     user_id = Column(String, ForeignKey("users.user_id"), primary_key=True)
     amount = Column(Numeric(precision=20, scale=2), default=Decimal('0'), nullable=False)
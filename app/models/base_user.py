@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Column, String, Boolean, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Boolean, DateTime, Enum as SQLEnum, Index, func
 from sqlalchemy.orm import relationship
 from database.database import Base
 
@@ -15,7 +15,7 @@ class BaseUser(Base):
     user_id = Column("user_id", String, primary_key=True)
     username = Column("username", String, unique=True, nullable=False)
     email = Column("email", String, unique=True, nullable=False)
-    password = Column("password", String, nullable=False)
+    password = Column("password", String)  # Устаревшая, не заполняется: пароль - только password_hash
     password_hash = Column("password_hash", String, nullable=False)
     role = Column("role", SQLEnum(UserRole), nullable=False)
     created_at = Column("created_at", DateTime, default=datetime.now)
@@ -24,4 +24,8 @@ class BaseUser(Base):
     balance = relationship("Balance", back_populates="user", uselist=False, cascade="all, delete-orphan")
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
     predictions = relationship("PredictionTask", back_populates="user", cascade="all, delete-orphan")
-    models = relationship("BaseMLModel", back_populates="owner", cascade="all, delete-orphan")
\ No newline at end of file
+    models = relationship("BaseMLModel", back_populates="owner", cascade="all, delete-orphan")
+
+# Вход по email или username без учёта регистра (verify_user): lower(...) = lower(:login)
+Index("ix_users_lower_email", func.lower(BaseUser.email), unique=True)
+Index("ix_users_lower_username", func.lower(BaseUser.username), unique=True)
@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Index
+from database.database import Base
+
+class IdempotencyKey(Base):
+    """Ответ на запрос с заголовком Idempotency-Key, сохранённый для повторов"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        # Удаление просроченных ключей
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
+
+    user_id = Column(String, ForeignKey("users.user_id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    endpoint = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
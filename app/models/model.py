@@ -2,7 +2,7 @@ from abc import ABC
 from datetime import datetime
 from enum import Enum
 from typing import Dict
-from sqlalchemy import Column, String, JSON, DateTime, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, String, Integer, JSON, DateTime, Enum as SQLEnum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database.database import Base
 
@@ -14,6 +14,10 @@ class MLModelStatus(Enum):
 
 class BaseMLModel(Base):
     __tablename__ = "models"
+    __table_args__ = (
+        # Модели владельца
+        Index("ix_models_owner_id", "owner_id"),
+    )
 
     model_id = Column(String, primary_key=True)
     name = Column(String, nullable=False)
@@ -23,6 +27,7 @@ class BaseMLModel(Base):
     model_metadata = Column(JSON, default={})
     model_type = Column(String, nullable=False)
     model_path = Column(String)
+    version = Column(Integer, default=1, nullable=False)  # Увеличивается при замене весов
 
     owner = relationship("BaseUser", back_populates="models")
     predictions = relationship("PredictionTask", back_populates="model", cascade="all, delete-orphan")
\ No newline at end of file
@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Index, text
+from database.database import Base
+
+class OutboxMessage(Base):
+    """Сообщение для RabbitMQ, записанное в одной транзакции с бизнес-данными"""
+    __tablename__ = "outbox"
+    __table_args__ = (
+        # Релей выбирает только неотправленные сообщения по порядку id
+        Index("ix_outbox_unsent", "id", postgresql_where=text("sent_at IS NULL"), sqlite_where=text("sent_at IS NULL")),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    routing_key = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String)
@@ -1,17 +1,27 @@
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Column, String, JSON, DateTime, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Enum as SQLEnum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database.database import Base
 
 
-class PredictionStatus(Enum):
+class PredictionStatus(str, Enum):
     PENDING = "pending"
+    PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
 
 class PredictionTask(Base):
     __tablename__ = "predictions"
+    __table_args__ = (
+        # Keyset-пагинация истории пользователя и модели: весь ключ курсора в индексе
+        Index("ix_predictions_user_id_created_at_task_id", "user_id", "created_at", "task_id"),
+        Index("ix_predictions_model_id_created_at_task_id", "model_id", "created_at", "task_id"),
+        # Поиск задач с просроченным heartbeat
+        Index("ix_predictions_status_heartbeat_at", "status", "heartbeat_at"),
+        # Heartbeat воркера: его задачи в processing
+        Index("ix_predictions_worker_id_status", "worker_id", "status"),
+    )
 
     task_id = Column(String, primary_key=True)
     user_id = Column(String, ForeignKey("users.user_id"))
@@ -21,6 +31,11 @@ class PredictionTask(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     result = Column(JSON)
     error = Column(String)
+    worker_id = Column(String)
+    heartbeat_at = Column(DateTime)
+    attempts = Column(Integer, default=0, nullable=False)
+    # Класс приоритета (services.scheduling.PriorityClass): очередь для повторной отправки
+    priority = Column(String, default="interactive", server_default="interactive", nullable=False)
     
     user = relationship("BaseUser", back_populates="predictions")
     model = relationship("BaseMLModel", back_populates="predictions")
\ No newline at end of file
@@ -0,0 +1,20 @@
+from decimal import Decimal
+from sqlalchemy import Column, Date, Integer, String, Numeric, Enum as SQLEnum, ForeignKey, Index
+from database.database import Base
+from models.balance import TransactionType
+
+class UsageDaily(Base):
+    """Сумма и число операций пользователя за день, по модели и типу транзакции"""
+    __tablename__ = "usage_daily"
+    __table_args__ = (
+        # Сводка пользователя за период
+        Index("ix_usage_daily_user_id_day", "user_id", "day"),
+    )
+
+    user_id = Column(String, ForeignKey("users.user_id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    # '' - операции без модели (пополнения и т.п.): NULL в первичном ключе недопустим
+    model_id = Column(String, primary_key=True, default="")
+    type = Column(SQLEnum(TransactionType), primary_key=True)
+    amount = Column(Numeric(precision=20, scale=2), default=Decimal('0'), nullable=False)
+    count = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,102 @@
+"""
+Холодный слой истории: сегменты JSONL.gz на диске.
+
+Сегмент - строки одного пользователя за месяц, отсортированные по
+(время, id) по убыванию, как и страницы истории. Файл пишется целиком
+во временный и переименовывается, а учитывается строкой archive_segments
+в той же транзакции, что удаляет перенесённые строки из горячей таблицы:
+файл без строки в archive_segments (сбой до commit) не читается.
+
+AsyncArchiveReader дочитывает страницу истории из сегментов, которые
+могут содержать строки новее курсора и старее последней строки горячей
+страницы, поэтому API отдаёт обе части одной лентой.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+from uuid import uuid4
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.config import settings
+from models.archive import ArchiveSegment
+from services.pagination import decode_cursor
+
+class ArchiveStore:
+    def __init__(self, root: str = None):
+        self.root = root or settings.ARCHIVE_DIR
+
+    def write(self, kind: str, user_id: str, period: str, records: Sequence) -> str:
+        """Записывает сегмент и возвращает его путь относительно root"""
+        # В имени файла - хеш user_id: идентификатор не попадает в путь как есть
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+        path = os.path.join(kind, period, digest[:2], f"{digest}-{uuid4().hex[:12]}.jsonl.gz")
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = full_path + ".tmp"
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+                for record in records:
+                    out.write(orjson.dumps(record, default=str) + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, full_path)
+        return path
+
+    def read(self, path: str) -> Iterator[Dict]:
+        with gzip.open(os.path.join(self.root, path), "rb") as lines:
+            for line in lines:
+                yield orjson.loads(line)
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+def _segments(kind: str, user_id: str, cursor: Optional[str]):
+    stmt = select(ArchiveSegment.path, ArchiveSegment.max_ts)\
+        .where(ArchiveSegment.user_id == user_id, ArchiveSegment.kind == kind)
+    if cursor:
+        timestamp, _ = decode_cursor(cursor)
+        stmt = stmt.where(ArchiveSegment.min_ts <= timestamp)
+    return stmt.order_by(ArchiveSegment.max_ts.desc())
+
+class AsyncArchiveReader:
+    def __init__(self, db: AsyncSession, store: ArchiveStore = None):
+        self.db = db
+        self.store = store or ArchiveStore()
+
+    def _load(self, path: str, from_json: Callable, sort_key: Callable, bound) -> List:
+        records = (from_json(row) for row in self.store.read(path))
+        if bound is None:
+            return list(records)
+        return [record for record in records if sort_key(record) < bound]
+
+    async def merge_page(self, kind: str, user_id: str, hot: List, limit: Optional[int],
+                         cursor: Optional[str], from_json: Callable, sort_key: Callable) -> List:
+        """Страница из горячих строк и архива в порядке sort_key по убыванию"""
+        segments = (await self.db.execute(_segments(kind, user_id, cursor))).all()
+        if not segments:
+            return hot
+
+        bound = decode_cursor(cursor) if cursor else None
+        page = list(hot)
+        for segment in segments:
+            # Сегменты идут от новых к старым: дальше строк новее последней на странице нет
+            if limit is not None and len(page) >= limit and segment.max_ts < sort_key(page[-1])[0]:
+                break
+            page.extend(await asyncio.to_thread(self._load, segment.path, from_json, sort_key, bound))
+            page.sort(key=sort_key, reverse=True)
+            if limit is not None:
+                del page[limit:]
+        return page
+
+    async def stream(self, kind: str, user_id: str, from_json: Callable) -> AsyncIterator:
+        """Все архивные строки пользователя, по сегментам от новых к старым"""
+        segments = (await self.db.execute(_segments(kind, user_id, None))).all()
+        for segment in segments:
+            for record in await asyncio.to_thread(self._load, segment.path, from_json, None, None):
+                yield record
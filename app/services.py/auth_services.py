@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from jose import jwt, JWTError
+from sqlalchemy import event, inspect
+from database.config import settings
+from models.base_user import BaseUser, UserRole
+from services.cache import TTLCache
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Лёгкое представление аутентифицированного пользователя (без ORM-сессии)"""
+    user_id: str
+    username: str
+    role: UserRole
+    is_active: bool
+    email: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: BaseUser) -> "UserPrincipal":
+        return cls(
+            user_id=str(user.user_id),
+            username=user.username,
+            role=UserRole(user.role),
+            is_active=bool(user.is_active),
+            email=user.email
+        )
+
+    @classmethod
+    def from_claims(cls, payload: Dict) -> Optional["UserPrincipal"]:
+        """Принципал из подписанных claims токена; None, если claims неполные"""
+        if "role" not in payload or "is_active" not in payload:
+            return None
+        try:
+            role = UserRole(payload["role"])
+        except ValueError:
+            return None
+        return cls(
+            user_id=payload["user_id"],
+            username=payload["sub"],
+            role=role,
+            is_active=bool(payload["is_active"])
+        )
+
+# Кэш принципалов по user_id: большинство запросов не обращаются к БД
+principal_cache = TTLCache(
+    maxsize=settings.AUTH_CACHE_MAXSIZE,
+    ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+
+class AuthService:
+    @staticmethod
+    def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
+        to_encode = data.copy()
+        expire = datetime.utcnow() + (
+            expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        to_encode["exp"] = expire
+        return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+    @staticmethod
+    def token_claims(user: BaseUser) -> Dict:
+        """Claims для токена: идентификатор, роль и признак активности"""
+        return {
+            "sub": user.username,
+            "user_id": str(user.user_id),
+            "role": UserRole(user.role).value,
+            "is_active": bool(user.is_active)
+        }
+
+    @staticmethod
+    def verify_token(token: str) -> Optional[Dict]:
+        try:
+            return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+
+    @staticmethod
+    def invalidate_user(user_id: str) -> None:
+        principal_cache.delete(str(user_id))
+
+@event.listens_for(BaseUser, "after_update")
+def _invalidate_on_update(mapper, connection, target: BaseUser) -> None:
+    """Сбрасывает кэш при изменении роли, активности или имени пользователя"""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("role", "is_active", "username")):
+        AuthService.invalidate_user(target.user_id)
+
+@event.listens_for(BaseUser, "after_delete")
+def _invalidate_on_delete(mapper, connection, target: BaseUser) -> None:
+    AuthService.invalidate_user(target.user_id)
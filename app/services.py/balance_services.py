@@ -1,9 +1,77 @@
+from dataclasses import dataclass
+from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict
-import threading
+from operator import attrgetter
+from typing import AsyncIterator, List, Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from models.balance import Transaction, Balance, TransactionType, TransactionStatus
 from models.base_user import BaseUser
+from database.config import settings
+from services import ledger
+from services.archive import AsyncArchiveReader
+from services.cache import TTLCache
+from services.pagination import paginate
+
+STREAM_BATCH_SIZE = 500
+
+# user_id -> наименьшая сумма, которую пользователю не удалось списать.
+# Баланс уменьшается только списаниями, поэтому запись верна до пополнения
+# (в других процессах API - не дольше FUNDS_CACHE_TTL_SECONDS)
+insufficient_funds_cache = TTLCache(
+    maxsize=settings.FUNDS_CACHE_MAXSIZE,
+    ttl=settings.FUNDS_CACHE_TTL_SECONDS
+)
+
+def known_insufficient(user_id: str, amount: Decimal) -> bool:
+    """Быстрая проверка без БД: списание amount заведомо не пройдёт"""
+    failed_amount = insufficient_funds_cache.get(user_id)
+    return failed_amount is not None and amount >= failed_amount
+
+def forget_insufficient(user_id: str) -> None:
+    """Сброс после зафиксированного пополнения; до commit параллельный отказ записал бы старый баланс"""
+    insufficient_funds_cache.delete(user_id)
+
+def _remember_insufficient(user_id: str, amount: Decimal) -> None:
+    failed_amount = insufficient_funds_cache.get(user_id)
+    if failed_amount is None or amount < failed_amount:
+        insufficient_funds_cache.set(user_id, amount)
+
+@dataclass(frozen=True, slots=True)
+class TransactionRecord:
+    """Строка истории без ORM-объекта и identity map"""
+    id: str
+    user_id: str
+    amount: Decimal
+    type: TransactionType
+    description: Optional[str]
+    status: TransactionStatus
+    timestamp: datetime
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "TransactionRecord":
+        """Строка из архивного сегмента (services.archive)"""
+        return cls(
+            id=data['id'],
+            user_id=data['user_id'],
+            amount=Decimal(data['amount']),
+            type=TransactionType(data['type']),
+            description=data['description'],
+            status=TransactionStatus(data['status']),
+            timestamp=datetime.fromisoformat(data['timestamp'])
+        )
+
+# Порядок колонок совпадает с полями TransactionRecord
+TRANSACTION_COLUMNS = (
+    Transaction.id, Transaction.user_id, Transaction.amount, Transaction.type,
+    Transaction.description, Transaction.status, Transaction.timestamp
+)
+
+def _history(user_id: str):
+    return select(*TRANSACTION_COLUMNS).where(Transaction.user_id == user_id)
+
+history_order = attrgetter('timestamp', 'id')
 
 class InsufficientFundsError(Exception):
     pass
@@ -14,58 +82,59 @@ class TransactionNotFoundError(Exception):
 class BalanceService:
     def __init__(self, db: Session):
         self.db = db
-        self._lock = threading.Lock()
 
     def get_balance(self, user: BaseUser) -> Decimal:
         balance = self.db.query(Balance).filter(Balance.user_id == user.user_id).first()
         return balance.amount if balance else Decimal('0')
 
-    def deposit(self, user: BaseUser, amount: Decimal, description: str = "") -> str:
+    def _apply(self, balance_stmt, user_id: str, amount: Decimal, tx_type: TransactionType,
+               description: str, model_id: Optional[str] = None, count: int = 1) -> Optional[str]:
+        """Изменяет баланс, пишет транзакцию и агрегат; None, если баланс не изменился"""
+        tx_id = ledger.new_transaction_id()
+        dialect_name = ledger.dialect_of(self.db)
+        if ledger.supports_cte(dialect_name):
+            row = self.db.execute(
+                ledger.with_transaction(balance_stmt, tx_id, amount, tx_type, description)
+            ).first()
+            if row is None:
+                return None
+        else:
+            if self.db.execute(balance_stmt).first() is None:
+                return None
+            self.db.execute(ledger.insert_transaction(tx_id, user_id, amount, tx_type, description))
+        self.db.execute(ledger.record_usage(dialect_name, user_id, amount, tx_type, model_id, count))
+        return tx_id
+
+    def deposit(self, user: BaseUser, amount: Decimal, description: str = "", commit: bool = True) -> str:
+        """При commit=False forget_insufficient вызывает сам вызывающий, после commit"""
         if amount <= Decimal('0'):
             raise ValueError("Amount must be positive")
 
-        with self._lock:
-            transaction = Transaction(
-                user_id=user.user_id,
-                amount=amount,
-                type=TransactionType.DEPOSIT,
-                status=TransactionStatus.PENDING,
-                description=description
-            )
-            self.db.add(transaction)
-
-            balance = self.db.query(Balance).filter(Balance.user_id == user.user_id).first()
-            if not balance:
-                balance = Balance(user_id=user.user_id, amount=Decimal('0'))
-                self.db.add(balance)
-
-            balance.amount += amount
-            transaction.status = TransactionStatus.COMPLETED
+        tx_id = self._apply(
+            ledger.credit_balance(ledger.dialect_of(self.db), user.user_id, amount),
+            user.user_id, amount, TransactionType.DEPOSIT, description
+        )
+        if commit:
             self.db.commit()
-            return transaction.id
+            forget_insufficient(user.user_id)
+        return tx_id
 
-    def withdraw(self, user_id: str, amount: Decimal, description: str = "") -> str:
+    def withdraw(self, user_id: str, amount: Decimal, description: str = "", commit: bool = True,
+                 model_id: Optional[str] = None, count: int = 1) -> str:
+        """count - число оплаченных операций (например, предсказаний в батче)"""
         if amount <= Decimal('0'):
             raise ValueError("Amount must be positive")
 
-        with self._lock:
-            balance = self.db.query(Balance).filter(Balance.user_id == user_id).first()
-            if not balance or balance.amount < amount:
-                raise InsufficientFundsError("Insufficient funds")
-
-            transaction = Transaction(
-                user_id=user_id,
-                amount=amount,
-                type=TransactionType.WITHDRAWAL,
-                status=TransactionStatus.PENDING,
-                description=description
-            )
-            self.db.add(transaction)
-
-            balance.amount -= amount
-            transaction.status = TransactionStatus.COMPLETED
+        tx_id = self._apply(
+            ledger.debit_balance(user_id, amount),
+            user_id, amount, TransactionType.WITHDRAWAL, description, model_id, count
+        )
+        if tx_id is None:
+            _remember_insufficient(user_id, amount)
+            raise InsufficientFundsError("Insufficient funds")
+        if commit:
             self.db.commit()
-            return transaction.id
+        return tx_id
 
     def make_payment(self, user_id: str, amount: Decimal, service_name: str, reference_id: str = None) -> str:
         description = f"Payment for {service_name}"
@@ -78,20 +147,12 @@ class BalanceService:
             description=description
         )
 
-    def get_transaction_history(self, user_id: str) -> List[Dict]:
-        transactions = self.db.query(Transaction)\
-            .filter(Transaction.user_id == user_id)\
-            .order_by(Transaction.timestamp.desc())\
-            .all()
-        
-        return [{
-            'id': tx.id,
-            'amount': tx.amount,
-            'type': tx.type,
-            'description': tx.description,
-            'status': tx.status,
-            'timestamp': tx.timestamp.isoformat()
-        } for tx in transactions]
+    def get_transaction_history(self, user_id: str, limit: Optional[int] = None,
+                                cursor: Optional[str] = None) -> List[TransactionRecord]:
+        result = self.db.execute(
+            paginate(_history(user_id), Transaction.timestamp, Transaction.id, limit, cursor)
+        )
+        return [TransactionRecord(*row) for row in result]
 
     def get_transaction(self, transaction_id: str) -> Dict:
         transaction = self.db.query(Transaction)\
@@ -109,4 +170,88 @@ class BalanceService:
             'status': transaction.status,
             'description': transaction.description,
             'timestamp': transaction.timestamp.isoformat()
-        }
\ No newline at end of file
+        }
+
+class AsyncBalanceService:
+    """Асинхронный вариант BalanceService для работы с AsyncSession"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _get_balance_row(self, user_id: str):
+        result = await self.db.execute(select(Balance).where(Balance.user_id == user_id))
+        return result.scalar_one_or_none()
+
+    async def get_balance(self, user: BaseUser) -> Decimal:
+        balance = await self._get_balance_row(user.user_id)
+        return balance.amount if balance else Decimal('0')
+
+    async def _apply(self, balance_stmt, user_id: str, amount: Decimal, tx_type: TransactionType,
+                     description: str, model_id: Optional[str] = None, count: int = 1) -> Optional[str]:
+        tx_id = ledger.new_transaction_id()
+        dialect_name = ledger.dialect_of(self.db)
+        if ledger.supports_cte(dialect_name):
+            result = await self.db.execute(
+                ledger.with_transaction(balance_stmt, tx_id, amount, tx_type, description)
+            )
+            if result.first() is None:
+                return None
+        else:
+            result = await self.db.execute(balance_stmt)
+            if result.first() is None:
+                return None
+            await self.db.execute(ledger.insert_transaction(tx_id, user_id, amount, tx_type, description))
+        await self.db.execute(ledger.record_usage(dialect_name, user_id, amount, tx_type, model_id, count))
+        return tx_id
+
+    async def deposit(self, user: BaseUser, amount: Decimal, description: str = "", commit: bool = True) -> str:
+        """При commit=False forget_insufficient вызывает сам вызывающий, после commit"""
+        if amount <= Decimal('0'):
+            raise ValueError("Amount must be positive")
+
+        tx_id = await self._apply(
+            ledger.credit_balance(ledger.dialect_of(self.db), user.user_id, amount),
+            user.user_id, amount, TransactionType.DEPOSIT, description
+        )
+        if commit:
+            await self.db.commit()
+            forget_insufficient(user.user_id)
+        return tx_id
+
+    async def withdraw(self, user_id: str, amount: Decimal, description: str = "", commit: bool = True,
+                       model_id: Optional[str] = None, count: int = 1) -> str:
+        if amount <= Decimal('0'):
+            raise ValueError("Amount must be positive")
+
+        tx_id = await self._apply(
+            ledger.debit_balance(user_id, amount),
+            user_id, amount, TransactionType.WITHDRAWAL, description, model_id, count
+        )
+        if tx_id is None:
+            _remember_insufficient(user_id, amount)
+            raise InsufficientFundsError("Insufficient funds")
+        if commit:
+            await self.db.commit()
+        return tx_id
+
+    async def get_transaction_history(self, user_id: str, limit: Optional[int] = None,
+                                      cursor: Optional[str] = None) -> List[TransactionRecord]:
+        result = await self.db.execute(
+            paginate(_history(user_id), Transaction.timestamp, Transaction.id, limit, cursor)
+        )
+        hot = [TransactionRecord(*row) for row in result]
+        return await AsyncArchiveReader(self.db).merge_page(
+            Transaction.__tablename__, user_id, hot, limit, cursor, TransactionRecord.from_json, history_order
+        )
+
+    async def stream_transaction_history(self, user_id: str) -> AsyncIterator[TransactionRecord]:
+        """Вся история транзакций через серверный курсор, пачками по STREAM_BATCH_SIZE, затем архив"""
+        stmt = paginate(_history(user_id), Transaction.timestamp, Transaction.id)\
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        result = await self.db.stream(stmt)
+        async for row in result:
+            yield TransactionRecord(*row)
+        async for record in AsyncArchiveReader(self.db).stream(
+            Transaction.__tablename__, user_id, TransactionRecord.from_json
+        ):
+            yield record
@@ -1,16 +1,26 @@
 import bcrypt
 import re
 from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.config import settings
 from models.base_user import BaseUser, UserRole
+from services.password_hasher import get_password_hasher
 from typing import Optional
 
+def _login_clause(username_or_email: str):
+    """Email или username без учёта регистра; покрывается индексами по lower(...)"""
+    login = username_or_email.lower()
+    return or_(func.lower(BaseUser.email) == login, func.lower(BaseUser.username) == login)
+
 class UserService:
     def __init__(self, db_session):
         self.db = db_session
     
     @staticmethod
     def _hash_password(password: str) -> str:
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
     
     @staticmethod
@@ -20,6 +30,9 @@ class UserService:
             raise ValueError("Invalid email format")
         return True
     
+    def get_by_username(self, username: str) -> Optional[BaseUser]:
+        return self.db.query(BaseUser).filter(BaseUser.username == username).first()
+    
     def create_user(self, user_data: dict) -> BaseUser:
         self.validate_email(user_data['email'])
         
@@ -46,15 +59,58 @@ class UserService:
     
     def verify_user(self, username_or_email: str, password: str) -> Optional[BaseUser]:
         # Позволяем аутентификацию по email или username
-        user = self.db.query(BaseUser).filter(
-            (BaseUser.email == username_or_email) | 
-            (BaseUser.username == username_or_email)
-        ).first()
+        user = self.db.query(BaseUser).filter(_login_clause(username_or_email)).first()
         
         if user and bcrypt.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8')):
             return user
         return None
 
+class AsyncUserService:
+    """Асинхронный вариант UserService для работы с AsyncSession"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.hasher = get_password_hasher()
+
+    async def get_by_username(self, username: str) -> Optional[BaseUser]:
+        result = await self.db.execute(
+            select(BaseUser).where(BaseUser.username == username)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_by_id(self, user_id: str) -> Optional[BaseUser]:
+        return await self.db.get(BaseUser, user_id)
+
+    async def create_user(self, user_data: dict) -> BaseUser:
+        UserService.validate_email(user_data['email'])
+
+        user = BaseUser(
+            user_id=user_data.get('user_id') or str(uuid4()),
+            username=user_data['username'],
+            email=user_data['email'],
+            password_hash=await self.hasher.hash(user_data['password']),
+            role=UserRole(user_data.get('role', 'regular'))
+        )
+
+        self.db.add(user)
+        await self.db.commit()
+        return user
+
+    async def verify_user(self, username_or_email: str, password: str) -> Optional[BaseUser]:
+        result = await self.db.execute(
+            select(BaseUser).where(_login_clause(username_or_email)).limit(1)
+        )
+        user = result.scalar_one_or_none()
+
+        if not user or not await self.hasher.verify(password, user.password_hash):
+            return None
+
+        # Пароль известен только при входе: пересчитываем хеш при смене cost-фактора
+        if self.hasher.needs_rehash(user.password_hash):
+            user.password_hash = await self.hasher.hash(password)
+            await self.db.commit()
+        return user
+
 class UserPermissionsService:
     @staticmethod
     def can_perform_action(user: BaseUser, action: str) -> bool:
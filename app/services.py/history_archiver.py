@@ -0,0 +1,134 @@
+"""
+Перенос старой истории в архив на диске.
+
+Завершённые задачи и проведённые транзакции старше ARCHIVE_AFTER_DAYS
+выбираются пачками по ARCHIVE_BATCH_SIZE, группируются по пользователю и
+месяцу и пишутся сегментами JSONL.gz в ARCHIVE_DIR (services.archive).
+Учёт сегментов и удаление строк из горячей таблицы - одна транзакция;
+на PostgreSQL строки блокируются FOR UPDATE SKIP LOCKED, поэтому
+несколько архиваторов не перенесут одну строку дважды.
+
+Задачи в pending/processing и транзакции в pending не переносятся.
+Архивные строки видны в истории и экспорте, но не в поиске по id
+(ожидание задачи, get_transaction).
+
+Запуск: python -m services.history_archiver
+"""
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import delete, select
+from database.config import settings
+from database.database import SessionLocal
+from models.archive import ArchiveSegment
+from models.balance import Transaction, TransactionStatus
+from models.prediction_history import PredictionTask
+from services import ledger
+from services.archive import ArchiveStore
+from services.balance_services import TRANSACTION_COLUMNS, TransactionRecord
+from services.balance_services import history_order as transaction_order
+from services.prediction_services import FINAL_STATUSES, PREDICTION_COLUMNS, PredictionRecord
+from services.prediction_services import history_order as prediction_order
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ArchiveKind:
+    model: type
+    columns: tuple
+    record_cls: type
+    timestamp_col: object
+    key_col: object
+    archivable: object  # условие WHERE для строк, которые можно переносить
+    order: Callable  # запись -> (время, id)
+
+    @property
+    def name(self) -> str:
+        return self.model.__tablename__
+
+KINDS = (
+    ArchiveKind(PredictionTask, PREDICTION_COLUMNS, PredictionRecord, PredictionTask.created_at,
+                PredictionTask.task_id, PredictionTask.status.in_(FINAL_STATUSES), prediction_order),
+    ArchiveKind(Transaction, TRANSACTION_COLUMNS, TransactionRecord, Transaction.timestamp,
+                Transaction.id, Transaction.status != TransactionStatus.PENDING, transaction_order),
+)
+
+class HistoryArchiver:
+    def __init__(self, session_factory=SessionLocal, store: ArchiveStore = None,
+                 after_days: int = None, batch_size: int = None):
+        self.session_factory = session_factory
+        self.store = store or ArchiveStore()
+        self.after = timedelta(days=after_days if after_days is not None else settings.ARCHIVE_AFTER_DAYS)
+        self.batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+
+    def _candidates(self, kind: ArchiveKind, dialect_name: str):
+        # Без ORDER BY: сортировка по времени требовала бы отдельного индекса,
+        # а порядок внутри пачки не важен - строки группируются по месяцам
+        stmt = select(*kind.columns)\
+            .where(
+                kind.timestamp_col < datetime.utcnow() - self.after,
+                kind.archivable,
+                kind.model.user_id.isnot(None)  # сегменты ведутся по пользователю
+            )\
+            .limit(self.batch_size)
+        if ledger.supports_cte(dialect_name):
+            stmt = stmt.with_for_update(skip_locked=True)
+        return stmt
+
+    def archive_once(self, kind: ArchiveKind) -> int:
+        """Переносит одну пачку; возвращает число перенесённых строк"""
+        session = self.session_factory()
+        written: List[str] = []
+        try:
+            records = [kind.record_cls(*row) for row in session.execute(
+                self._candidates(kind, ledger.dialect_of(session))
+            )]
+            if not records:
+                return 0
+
+            groups: Dict[Tuple[str, str], List] = defaultdict(list)
+            for record in records:
+                groups[(record.user_id, kind.order(record)[0].strftime("%Y-%m"))].append(record)
+            for (user_id, period), rows in groups.items():
+                rows.sort(key=kind.order, reverse=True)
+                path = self.store.write(kind.name, user_id, period, rows)
+                written.append(path)
+                session.add(ArchiveSegment(
+                    kind=kind.name, user_id=user_id, period=period, path=path, rows=len(rows),
+                    min_ts=kind.order(rows[-1])[0], max_ts=kind.order(rows[0])[0]
+                ))
+            keys = [kind.order(record)[1] for record in records]
+            session.execute(
+                delete(kind.model).where(kind.key_col.in_(keys)).execution_options(synchronize_session=False)
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            # Без строки в archive_segments файлы не читаются, но место занимают
+            for path in written:
+                self.store.remove(path)
+            raise
+        finally:
+            session.close()
+        logger.info("Archived %d %s rows into %d segments", len(records), kind.name, len(written))
+        return len(records)
+
+    def run(self) -> None:
+        logger.info("History archiver started: after=%s, batch=%d, dir=%s",
+                    self.after, self.batch_size, self.store.root)
+        while True:
+            for kind in KINDS:
+                try:
+                    # Полная пачка - вероятно, есть ещё
+                    while self.archive_once(kind) == self.batch_size:
+                        pass
+                except Exception:
+                    logger.exception("Failed to archive %s", kind.name)
+            time.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    HistoryArchiver().run()
@@ -0,0 +1,90 @@
+"""
+Хранилище ответов для запросов с заголовком Idempotency-Key.
+
+Ответ сохраняется в той же транзакции, что и сама операция (списание,
+пополнение), поэтому операция и ключ фиксируются вместе. Повтор с тем же
+ключом получает сохранённый ответ без повторной обработки. Одновременные
+повторы упираются в первичный ключ (user_id, key): проигравший запрос
+откатывается и тоже отдаёт сохранённый ответ. Перед БД стоит in-process
+TTLCache; ключи старше IDEMPOTENCY_TTL_HOURS удаляет purge_expired.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database.config import settings
+from models.idempotency import IdempotencyKey
+from services.cache import TTLCache
+
+class IdempotencyKeyReusedError(Exception):
+    """Ключ уже использован для другого запроса"""
+
+@dataclass(frozen=True)
+class StoredResponse:
+    request_hash: str
+    status_code: int
+    response: Any
+
+stored_responses = TTLCache(
+    maxsize=settings.IDEMPOTENCY_CACHE_MAXSIZE,
+    ttl=settings.IDEMPOTENCY_TTL_HOURS * 3600
+)
+
+def request_fingerprint(endpoint: str, payload: Dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{endpoint}\n{canonical}".encode("utf-8")).hexdigest()
+
+def _check(stored: StoredResponse, request_hash: str) -> StoredResponse:
+    if stored.request_hash != request_hash:
+        raise IdempotencyKeyReusedError("Idempotency-Key was already used for a different request")
+    return stored
+
+class AsyncIdempotencyService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def lookup(self, user_id: str, key: str, request_hash: str) -> Optional[StoredResponse]:
+        """Сохранённый ответ на этот ключ или None, если запрос новый"""
+        stored = stored_responses.get((user_id, key))
+        if stored is None:
+            result = await self.db.execute(
+                select(IdempotencyKey.request_hash, IdempotencyKey.status_code, IdempotencyKey.response)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            )
+            row = result.first()
+            if row is None:
+                return None
+            stored = StoredResponse(row.request_hash, row.status_code, row.response)
+            stored_responses.set((user_id, key), stored)
+        return _check(stored, request_hash)
+
+    async def store(self, user_id: str, key: str, endpoint: str, request_hash: str,
+                    status_code: int, response: Any) -> None:
+        """Запись ответа в текущую транзакцию; commit делает вызывающий код"""
+        await self.db.execute(insert(IdempotencyKey).values(
+            user_id=user_id,
+            key=key,
+            endpoint=endpoint,
+            request_hash=request_hash,
+            status_code=status_code,
+            response=response,
+            created_at=datetime.utcnow()
+        ))
+
+    def remember(self, user_id: str, key: str, request_hash: str, status_code: int, response: Any) -> None:
+        """В кэш - только после успешного commit"""
+        stored_responses.set((user_id, key), StoredResponse(request_hash, status_code, response))
+
+class IdempotencyService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def purge_expired(self, ttl: timedelta = None) -> int:
+        threshold = datetime.utcnow() - (ttl or timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS))
+        result = self.db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < threshold))
+        self.db.commit()
+        return result.rowcount
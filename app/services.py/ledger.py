@@ -0,0 +1,105 @@
+"""
+Построители SQL-операторов для атомарного изменения баланса.
+
+Списание выполняется одним условным UPDATE (amount >= :amount), поэтому
+баланс не уходит в минус даже при конкурентных запросах из разных
+процессов: строка баланса блокируется самим UPDATE до конца транзакции.
+На PostgreSQL изменение баланса и вставка записи в transactions
+объединяются в один оператор через data-modifying CTE. В той же
+транзакции обновляется дневной агрегат usage_daily.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+from uuid import uuid4
+from sqlalchemy import insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models.balance import Balance, Transaction, TransactionType, TransactionStatus
+from models.usage import UsageDaily
+
+# Диалекты, поддерживающие UPDATE/INSERT внутри WITH
+CTE_DIALECTS = {"postgresql"}
+
+def new_transaction_id() -> str:
+    return f"tx_{uuid4().hex}"
+
+def supports_cte(dialect_name: str) -> bool:
+    return dialect_name in CTE_DIALECTS
+
+def debit_balance(user_id: str, amount: Decimal):
+    """UPDATE, списывающий amount только при достаточном балансе"""
+    return update(Balance)\
+        .where(Balance.user_id == user_id, Balance.amount >= amount)\
+        .values(amount=Balance.amount - amount, updated_at=datetime.utcnow())\
+        .returning(Balance.user_id, Balance.amount)
+
+def _dialect_insert(dialect_name: str):
+    return postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+
+def credit_balance(dialect_name: str, user_id: str, amount: Decimal):
+    """UPSERT, зачисляющий amount и создающий строку баланса при необходимости"""
+    dialect_insert = _dialect_insert(dialect_name)
+    now = datetime.utcnow()
+    stmt = dialect_insert(Balance).values(user_id=user_id, amount=amount, updated_at=now)
+    return stmt.on_conflict_do_update(
+        index_elements=[Balance.user_id],
+        set_={"amount": Balance.amount + amount, "updated_at": now}
+    ).returning(Balance.user_id, Balance.amount)
+
+def record_usage(dialect_name: str, user_id: str, amount: Decimal, tx_type: TransactionType,
+                 model_id: Optional[str] = None, count: int = 1):
+    """UPSERT дневного агрегата: сводки читаются без сканирования transactions"""
+    stmt = _dialect_insert(dialect_name)(UsageDaily).values(
+        user_id=user_id,
+        day=datetime.utcnow().date(),
+        model_id=model_id or "",
+        type=tx_type,
+        amount=amount,
+        count=count
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[UsageDaily.user_id, UsageDaily.day, UsageDaily.model_id, UsageDaily.type],
+        set_={"amount": UsageDaily.amount + amount, "count": UsageDaily.count + count}
+    )
+
+def insert_transaction(tx_id: str, user_id: str, amount: Decimal,
+                       tx_type: TransactionType, description: str = ""):
+    return insert(Transaction).values(
+        id=tx_id,
+        user_id=user_id,
+        amount=amount,
+        type=tx_type,
+        status=TransactionStatus.COMPLETED,
+        description=description,
+        timestamp=datetime.utcnow()
+    )
+
+def with_transaction(balance_stmt, tx_id: str, amount: Decimal,
+                     tx_type: TransactionType, description: str = ""):
+    """
+    Объединяет изменение баланса и вставку транзакции в один оператор
+    (только для диалектов из CTE_DIALECTS). Если balance_stmt не затронул
+    ни одной строки, транзакция не вставляется и RETURNING пуст.
+    """
+    balance_cte = balance_stmt.cte("balance_change")
+    columns = Transaction.__table__.c
+    rows = select(
+        literal(tx_id, columns.id.type),
+        balance_cte.c.user_id,
+        literal(amount, columns.amount.type),
+        literal(tx_type, columns.type.type),
+        literal(TransactionStatus.COMPLETED, columns.status.type),
+        literal(description, columns.description.type),
+        literal(datetime.utcnow(), columns.timestamp.type)
+    )
+    return insert(Transaction)\
+        .from_select(
+            ["id", "user_id", "amount", "type", "status", "description", "timestamp"],
+            rows
+        )\
+        .add_cte(balance_cte)\
+        .returning(Transaction.id)
+
+def dialect_of(session) -> str:
+    """Имя диалекта для Session и AsyncSession"""
+    return session.get_bind().dialect.name
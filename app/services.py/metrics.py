@@ -0,0 +1,249 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Счётчики и гистограммы с метками хранятся в памяти процесса и
+отдаются эндпоинтом /metrics (API) или serve_metrics (воркер).
+instrument_engine вешает на движок SQLAlchemy хуки, которые считают
+запросы и время БД в рамках текущего HTTP-запроса (RequestStats в
+contextvar) и предупреждают о вероятных N+1: один и тот же SQL больше
+N_PLUS_ONE_THRESHOLD раз за запрос. instrument_pool публикует загрузку
+пула соединений. instrument_database подключает оба к движкам
+database.database и вызывается из точки входа процесса (MetricsMiddleware
+в API, __main__ воркеров), а не при импорте слоя БД.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from database import database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+N_PLUS_ONE_THRESHOLD = 10
+INF_BUCKET = 'le="+Inf"'
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {total}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, *label_values: str, value: float) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> (счётчики по корзинам, сумма, количество)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values: str, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(label_values) or ([0] * len(self.buckets), 0.0, 0)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[label_values] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*label_values, value=time.perf_counter() - started)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = _format_labels(self.labels, values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, INF_BUCKET)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ("route",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200)
+)
+db_time_per_request = registry.histogram("db_seconds_per_request", "Time spent in SQL per HTTP request", ("route",))
+db_queries = registry.counter("db_queries_total", "SQL statements executed", ("engine",))
+db_query_latency = registry.histogram("db_query_duration_seconds", "SQL statement latency", ("engine",))
+n_plus_one = registry.counter("db_n_plus_one_total", "Requests repeating one statement too often", ("route",))
+broker_publish_latency = registry.histogram(
+    "broker_publish_duration_seconds", "Publish latency including broker confirms", ("routing_key",)
+)
+broker_messages = registry.counter("broker_messages_total", "Messages published or consumed", ("queue", "direction"))
+worker_batch_latency = registry.histogram("worker_batch_duration_seconds", "Worker batch processing time", ("model_id",))
+worker_queue_wait = registry.histogram(
+    "worker_queue_wait_seconds", "Time from publishing a task until the worker takes it", ("model_id",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+
+db_pool_checked_out = registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool", ("engine",))
+db_pool_capacity = registry.gauge("db_pool_capacity", "pool_size + max_overflow of the pool", ("engine",))
+db_pool_connects = registry.counter("db_pool_connections_total", "New DBAPI connections opened by the pool", ("engine",))
+db_pool_invalidated = registry.counter(
+    "db_pool_invalidated_total", "Connections dropped by pre-ping or after errors", ("engine",)
+)
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: StatementCounter = StatementCounter()
+
+    def suspected_n_plus_one(self) -> Optional[Tuple[str, int]]:
+        if not self.statements:
+            return None
+        statement, count = self.statements.most_common(1)[0]
+        return (statement, count) if count > N_PLUS_ONE_THRESHOLD else None
+
+request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+def instrument_engine(engine, name: str) -> None:
+    """Хуки подсчёта запросов для Engine (для AsyncEngine - его sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_queries.inc(name)
+        db_query_latency.observe(name, value=elapsed)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            stats.statements[statement] += 1
+
+def instrument_pool(engine, name: str) -> None:
+    """Насыщение пула: занятые соединения против pool_size + max_overflow"""
+    pool = engine.pool
+    size = getattr(pool, "size", None)
+    if callable(size):
+        db_pool_capacity.set(name, value=size() + max(getattr(pool, "_max_overflow", 0), 0))
+
+    # checkin вызывается до возврата соединения в пул, поэтому считаем сами, а не pool.checkedout()
+    event.listen(engine, "checkout", lambda *args: db_pool_checked_out.inc(name))
+    event.listen(engine, "checkin", lambda *args: db_pool_checked_out.inc(name, amount=-1))
+    event.listen(engine, "connect", lambda *args: db_pool_connects.inc(name))
+    event.listen(engine, "invalidate", lambda *args: db_pool_invalidated.inc(name))
+
+_database_instrumented = False
+
+def instrument_database() -> None:
+    """Хуки на движки приложения; повторный вызов ничего не делает"""
+    global _database_instrumented
+    if _database_instrumented:
+        return
+    _database_instrumented = True
+    engines = [("sync", database.engine), ("async", database.async_engine.sync_engine)]
+    if database.async_read_engine is not database.async_engine:
+        engines.append(("replica", database.async_read_engine.sync_engine))
+    for name, engine in engines:
+        instrument_engine(engine, name)
+        instrument_pool(engine, name)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """/metrics для процессов без FastAPI (воркер) в фоновом потоке"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,302 @@
+"""
+ML-воркер: читает задачи из очередей предсказаний и выполняет их
+микробатчами.
+
+Интерактивные и пакетные задачи приходят из разных очередей и проходят
+через FairScheduler, который делит пропускную способность воркера между
+классами приоритета и пользователями. Затем сообщения накапливаются
+отдельно для каждой model_id. Батч отправляется в модель, когда набрано
+WORKER_BATCH_SIZE сообщений или самое старое из них ждёт дольше
+WORKER_BATCH_MAX_WAIT_MS. Результаты батча пишутся в БД одним UPDATE,
+после чего сообщения подтверждаются.
+
+Перед выполнением батча задачи переводятся в processing с worker_id
+воркера. Пока есть задачи в обработке, фоновый поток раз в
+TASK_HEARTBEAT_INTERVAL_SECONDS обновляет heartbeat_at одним UPDATE;
+зависшие задачи подбирает services.task_reaper. Если записать итоги
+батча не удалось, задачи возвращаются в pending, а сообщения - в очередь.
+
+Запуск: python -m services.ml_worker
+"""
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+import pika
+from database.config import settings
+from database.database import SessionLocal
+from models.model import BaseMLModel
+from services.metrics import (
+    broker_messages, instrument_database, serve_metrics, worker_batch_latency, worker_queue_wait
+)
+from services.model_registry import ModelRegistry
+from services.prediction_cache import PredictionCache, get_prediction_cache, model_cache_key
+from services.model_services import TensorFlowModelService
+from services.prediction_services import PredictionService
+from services.rmq.publisher import encode_message
+from services.scheduling import FairScheduler, PriorityClass, worker_queues
+from services.task_events import TASK_EVENTS_EXCHANGE, build_task_event
+
+logger = logging.getLogger(__name__)
+
+# (delivery_tag, сообщение)
+Delivery = Tuple[int, Dict]
+
+class MicroBatcher:
+    """Группирует сообщения по model_id и решает, когда батч готов"""
+
+    def __init__(self, max_size: int, max_wait: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._clock = clock
+        self._pending: Dict[str, List[Delivery]] = {}
+        self._started: Dict[str, float] = {}
+
+    def add(self, delivery_tag: int, message: Dict) -> None:
+        model_id = message['model_id']
+        if model_id not in self._pending:
+            self._pending[model_id] = []
+            self._started[model_id] = self._clock()
+        self._pending[model_id].append((delivery_tag, message))
+
+    def ready(self, force: bool = False) -> List[Tuple[str, List[Delivery]]]:
+        """Забирает готовые батчи (все накопленные при force=True)"""
+        now = self._clock()
+        batches = []
+        for model_id in list(self._pending):
+            deliveries = self._pending[model_id]
+            if force or len(deliveries) >= self.max_size or now - self._started[model_id] >= self.max_wait:
+                del self._pending[model_id], self._started[model_id]
+                for start in range(0, len(deliveries), self.max_size):
+                    batches.append((model_id, deliveries[start:start + self.max_size]))
+        return batches
+
+    def __len__(self) -> int:
+        return sum(len(deliveries) for deliveries in self._pending.values())
+
+class MLWorker:
+    def __init__(self, session_factory=SessionLocal, registry: ModelRegistry = None,
+                 cache: PredictionCache = None):
+        self.session_factory = session_factory
+        self.cache = cache or (get_prediction_cache() if settings.PREDICTION_CACHE_ENABLED else None)
+        self.registry = registry or ModelRegistry(
+            max_models=settings.MODEL_REGISTRY_MAX_MODELS,
+            memory_budget=settings.MODEL_REGISTRY_MEMORY_BUDGET_MB * 1024 * 1024
+        )
+        self.batcher = MicroBatcher(
+            max_size=settings.WORKER_BATCH_SIZE,
+            max_wait=settings.WORKER_BATCH_MAX_WAIT_MS / 1000
+        )
+        self.scheduler = FairScheduler({
+            PriorityClass.INTERACTIVE: settings.WORKER_INTERACTIVE_WEIGHT,
+            PriorityClass.BULK: settings.WORKER_BULK_WEIGHT
+        })
+        self.queues = worker_queues()
+        self.queue_depths: Dict[str, int] = {}
+        self._depths_checked_at = 0.0
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.heartbeat_timeout = timedelta(seconds=settings.TASK_HEARTBEAT_TIMEOUT_SECONDS)
+        self._in_flight = 0
+        self._stopped = threading.Event()
+
+    def _get_model(self, session, model_id: str) -> BaseMLModel:
+        model = session.get(BaseMLModel, model_id)
+        if model is None:
+            raise ValueError(f"Model {model_id} not found")
+        return model
+
+    def _predict(self, model: BaseMLModel, messages: List[Dict]) -> Dict[str, Dict]:
+        """Результаты task_id -> output; повторяющиеся и уже закэшированные входы не считаются"""
+        results: Dict[str, Dict] = {}
+        misses: Dict[str, List[Dict]] = {}
+        for message in messages:
+            key = model_cache_key(model, message['input_data'])
+            cached = self.cache.get(key) if self.cache else None
+            if cached is not None:
+                results[message['task_id']] = cached
+            else:
+                misses.setdefault(key, []).append(message)
+
+        if misses:
+            service: TensorFlowModelService = self.registry.get(model.model_id, model.version, model.model_path)
+            keys = list(misses)
+            outputs = service.predict_batch([misses[key][0]['input_data'] for key in keys])
+            for key, output in zip(keys, outputs):
+                if self.cache:
+                    self.cache.set(key, output)
+                for message in misses[key]:
+                    results[message['task_id']] = output
+        return results
+
+    def preload_models(self) -> None:
+        model_ids = [m.strip() for m in settings.WORKER_PRELOAD_MODELS.split(",") if m.strip()]
+        if not model_ids:
+            return
+        session = self.session_factory()
+        try:
+            models = session.query(BaseMLModel).filter(BaseMLModel.model_id.in_(model_ids)).all()
+            self.registry.preload((m.model_id, m.version, m.model_path) for m in models)
+        finally:
+            session.close()
+        logger.info("Preloaded models: %s", self.registry.stats())
+
+    def process_batch(self, model_id: str, messages: List[Dict]) -> List[Dict]:
+        """
+        Выполняет батч одной модели, пишет результаты bulk UPDATE и
+        возвращает события завершения задач для подписчиков.
+        """
+        session = self.session_factory()
+        try:
+            service = PredictionService(session)
+            # Повторно доставленные сообщения завершённых задач и задач живого воркера не считаем
+            claimed = service.claim_tasks([message['task_id'] for message in messages], self.worker_id,
+                                          self.heartbeat_timeout)
+            messages = [message for message in messages if message['task_id'] in claimed]
+            if not messages:
+                return []
+            users = {message['task_id']: message.get('user_id') for message in messages}
+            self._in_flight += 1
+            try:
+                results = self._predict(self._get_model(session, model_id), messages)
+            except Exception as e:
+                logger.exception("Batch of %d tasks for model %s failed", len(messages), model_id)
+                errors = {task_id: str(e) for task_id in users}
+                self._store(service, service.fail_tasks, errors)
+                return [build_task_event(task_id, user_id, "failed", error=errors[task_id])
+                        for task_id, user_id in users.items()]
+            finally:
+                self._in_flight -= 1
+            self._store(service, service.complete_tasks, results)
+            return [build_task_event(task_id, users[task_id], "completed", result=result)
+                    for task_id, result in results.items()]
+        finally:
+            session.close()
+
+    def _store(self, service: PredictionService, write: Callable[[Dict], None], items: Dict) -> None:
+        """
+        Запись итогов батча. Если она не удалась, задачи возвращаются в
+        pending: иначе claim_tasks отбросит повторную доставку как задачи
+        живого воркера, а heartbeat будет продлевать их бесконечно.
+        """
+        try:
+            write(items)
+        except Exception:
+            service.db.rollback()
+            session = self.session_factory()
+            try:
+                PredictionService(session).release_tasks(list(items), self.worker_id)
+            except Exception:
+                logger.exception("Failed to release %d tasks", len(items))
+            finally:
+                session.close()
+            raise
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stopped.wait(settings.TASK_HEARTBEAT_INTERVAL_SECONDS):
+            if not self._in_flight:
+                continue
+            session = self.session_factory()
+            try:
+                PredictionService(session).heartbeat(self.worker_id)
+            except Exception:
+                logger.exception("Failed to record heartbeat")
+            finally:
+                session.close()
+
+    def _flush(self, channel, force: bool = False) -> None:
+        for model_id, deliveries in self.batcher.ready(force=force):
+            try:
+                with worker_batch_latency.time(model_id):
+                    events = self.process_batch(model_id, [message for _, message in deliveries])
+            except Exception:
+                # Ошибка записи в БД: возвращаем сообщения в очередь
+                logger.exception("Failed to store results for model %s", model_id)
+                for delivery_tag, _ in deliveries:
+                    channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+                continue
+            for delivery_tag, _ in deliveries:
+                channel.basic_ack(delivery_tag=delivery_tag)
+            for event in events:
+                channel.basic_publish(exchange=TASK_EVENTS_EXCHANGE, routing_key='', body=encode_message(event))
+
+    def _on_message(self, priority: PriorityClass, channel, method, properties, body) -> None:
+        try:
+            message = json.loads(body)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict) or 'model_id' not in message:
+            logger.error("Dropping malformed message: %r", body)
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        broker_messages.inc(method.routing_key, "consumed")
+        self._observe_queue_wait(message)
+        self.scheduler.add(priority, message.get('user_id'), (method.delivery_tag, message))
+
+    @staticmethod
+    def _observe_queue_wait(message: Dict) -> None:
+        try:
+            published_at = datetime.fromisoformat(message['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            return
+        worker_queue_wait.observe(message['model_id'], value=(datetime.utcnow() - published_at).total_seconds())
+
+    def _schedule(self) -> None:
+        """Переносит задачи из планировщика в батчер в справедливом порядке"""
+        while len(self.scheduler) and len(self.batcher) < self.batcher.max_size:
+            delivery_tag, message = self.scheduler.pop()
+            self.batcher.add(delivery_tag, message)
+
+    def _check_queue_depths(self, channel) -> None:
+        now = time.monotonic()
+        if now - self._depths_checked_at < settings.WORKER_QUEUE_DEPTH_INTERVAL_SECONDS:
+            return
+        self._depths_checked_at = now
+        for _, queue in self.queues:
+            self.queue_depths[queue] = channel.queue_declare(queue=queue, durable=True, passive=True).method.message_count
+        logger.info("Queue depths: %s, buffered: interactive=%d bulk=%d", self.queue_depths,
+                    self.scheduler.depth(PriorityClass.INTERACTIVE), self.scheduler.depth(PriorityClass.BULK))
+
+    def run(self) -> None:
+        if settings.WORKER_METRICS_PORT:
+            serve_metrics(settings.WORKER_METRICS_PORT)
+        self.preload_models()
+        connection = pika.BlockingConnection(pika.URLParameters(settings.RABBITMQ_URL))
+        channel = connection.channel()
+        channel.exchange_declare(exchange=TASK_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+        # prefetch действует на каждого consumer отдельно: пакетная очередь
+        # не может занять окно интерактивной
+        channel.basic_qos(prefetch_count=settings.WORKER_PREFETCH)
+        for priority, queue in self.queues:
+            channel.queue_declare(queue=queue, durable=True)
+            channel.basic_consume(queue, functools.partial(self._on_message, priority))
+
+        logger.info("ML worker started: queues=%s, batch=%d, max_wait=%dms, prefetch=%d",
+                    [queue for _, queue in self.queues], settings.WORKER_BATCH_SIZE,
+                    settings.WORKER_BATCH_MAX_WAIT_MS, settings.WORKER_PREFETCH)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                # Даже без новых сообщений батч уходит в модель не позже чем через 2 * max_wait
+                connection.process_data_events(time_limit=self.batcher.max_wait)
+                self._schedule()
+                self._flush(channel)
+                self._check_queue_depths(channel)
+        finally:
+            while len(self.scheduler) or len(self.batcher):
+                self._schedule()
+                self._flush(channel, force=True)
+            self._stopped.set()
+            channel.stop_consuming()
+            connection.close()
+            logger.info("Model registry: %s", self.registry.stats())
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    instrument_database()
+    MLWorker().run()
@@ -0,0 +1,113 @@
+"""
+Реестр загруженных моделей воркера.
+
+Модель загружается один раз на (model_id, version) и остаётся в памяти,
+пока не будет вытеснена по LRU: при превышении числа моделей или
+бюджета памяти. Размер модели оценивается по размеру файлов model_path.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from services.model_services import TensorFlowModelService
+
+logger = logging.getLogger(__name__)
+
+ModelKey = Tuple[str, int]
+
+def path_size(path: Optional[str]) -> int:
+    """Размер файла или каталога модели на диске, байт"""
+    if not path or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+class ModelRegistry:
+    def __init__(self, max_models: int = 8, memory_budget: int = 0,
+                 loader: Callable[[str], TensorFlowModelService] = TensorFlowModelService,
+                 size_of: Callable[[Optional[str]], int] = path_size):
+        self.max_models = max_models
+        self.memory_budget = memory_budget  # 0 - без ограничения
+        self._loader = loader
+        self._size_of = size_of
+        self._models: "OrderedDict[ModelKey, Tuple[TensorFlowModelService, int]]" = OrderedDict()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds: Dict[ModelKey, float] = {}
+
+    def _resident_bytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def _evict_over_budget(self) -> None:
+        while self._models and (
+            len(self._models) > self.max_models
+            or (self.memory_budget and self._resident_bytes() > self.memory_budget and len(self._models) > 1)
+        ):
+            key, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logger.info("Evicted model %s v%s", *key)
+
+    def get(self, model_id: str, version: int, model_path: str) -> TensorFlowModelService:
+        key = (model_id, version)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Одна загрузка на ключ: параллельные запросы ждут её, а не грузят модель повторно
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    return entry[0]
+
+            started = time.perf_counter()
+            model = self._loader(model_path)
+            elapsed = time.perf_counter() - started
+            size = self._size_of(model_path)
+
+            with self._lock:
+                # Старые версии этой модели больше не нужны
+                for stale in [k for k in self._models if k[0] == model_id and k != key]:
+                    del self._models[stale]
+                self._models[key] = (model, size)
+                self.load_seconds[key] = elapsed
+                self._load_locks.pop(key, None)
+                self._evict_over_budget()
+            logger.info("Loaded model %s v%s in %.3fs (%d bytes)", model_id, version, elapsed, size)
+            return model
+
+    def preload(self, models: Iterable[Tuple[str, int, str]]) -> None:
+        """Загрузка «горячих» моделей при старте: (model_id, version, model_path)"""
+        for model_id, version, model_path in models:
+            self.get(model_id, version, model_path)
+
+    def evict(self, model_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._models if k[0] == model_id]:
+                del self._models[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'resident': len(self._models),
+                'resident_bytes': self._resident_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'load_seconds_total': sum(self.load_seconds.values())
+            }
@@ -1,22 +1,20 @@
-import pika
-import json
 from datetime import datetime
 from models.model import BaseMLModel, MLModelStatus
 from models.base_user import BaseUser
-from typing import Dict
+from models.outbox import OutboxMessage
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.scheduling import PriorityClass, queue_name
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy приходит вместе с TensorFlow, без него - поштучный predict
+    np = None
 
 class ModelService:
     def __init__(self, db_session):
         self.db = db_session
-        self.rabbit_connection = self._init_rabbitmq()
-    
-    def _init_rabbitmq(self):
-        """Инициализация подключения к RabbitMQ"""
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters('rabbitmq'))
-        channel = connection.channel()
-        channel.queue_declare(queue='model_predictions', durable=True)
-        return connection
     
     def create_model(self, model_data: Dict) -> BaseMLModel:
         model = BaseMLModel(
@@ -30,29 +28,70 @@ class ModelService:
         self.db.commit()
         return model
     
-    def publish_prediction_task(self, model_id: str, input_data: Dict) -> str:
-        """Публикация задачи на предсказание в RabbitMQ"""
-        channel = self.rabbit_connection.channel()
-        task_id = str(uuid.uuid4())
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key='model_predictions',
-            body=json.dumps({
-                'task_id': task_id,
-                'model_id': model_id,
-                'input_data': input_data,
-                'timestamp': datetime.utcnow().isoformat()
-            }),
-            properties=pika.BasicProperties(
-                delivery_mode=2  # Сохранять сообщения при перезапуске
-            )
-        )
-        return task_id
+    @staticmethod
+    def build_prediction_message(task_id: str, model_id: str, input_data: Dict,
+                                 user_id: Optional[str] = None) -> Dict:
+        return {
+            'task_id': task_id,
+            'model_id': model_id,
+            'user_id': user_id,
+            'input_data': input_data,
+            'timestamp': datetime.utcnow().isoformat()
+        }
     
     def change_status(self, model: BaseMLModel, status: MLModelStatus) -> None:
         model.status = status
         self.db.commit()
+    
+    def update_model_path(self, model: BaseMLModel, model_path: str) -> None:
+        """Новые веса модели: версия растёт, воркеры перезагружают модель"""
+        model.model_path = model_path
+        model.version = (model.version or 1) + 1
+        self.db.commit()
+
+class AsyncModelService:
+    """Асинхронный вариант ModelService для работы с AsyncSession"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_model(self, model_data: Dict) -> BaseMLModel:
+        model = BaseMLModel(
+            model_id=model_data['model_id'],
+            name=model_data['name'],
+            owner_id=model_data['owner_id'],
+            model_type=model_data.get('model_type', 'base'),
+            model_path=model_data.get('model_path')
+        )
+        self.db.add(model)
+        await self.db.commit()
+        return model
+
+    async def enqueue_prediction_tasks(self, model_id: str, tasks: List[Tuple[str, Dict]],
+                                       user_id: Optional[str] = None,
+                                       priority: PriorityClass = PriorityClass.INTERACTIVE) -> None:
+        """
+        Запись задач в outbox в текущей транзакции сессии, без commit.
+        В RabbitMQ их публикует services.outbox_relay после фиксации.
+        """
+        routing_key = queue_name(priority, model_id)
+        await self.db.execute(insert(OutboxMessage), [
+            {
+                'routing_key': routing_key,
+                'payload': ModelService.build_prediction_message(task_id, model_id, input_data, user_id)
+            }
+            for task_id, input_data in tasks
+        ])
+    
+    async def change_status(self, model: BaseMLModel, status: MLModelStatus) -> None:
+        model.status = status
+        await self.db.commit()
+
+    async def update_model_path(self, model: BaseMLModel, model_path: str) -> None:
+        """Новые веса модели: версия растёт, воркеры перезагружают модель"""
+        model.model_path = model_path
+        model.version = (model.version or 1) + 1
+        await self.db.commit()
 
 class TensorFlowModelService:
     def __init__(self, model_path: str):
@@ -67,4 +106,24 @@ class TensorFlowModelService:
     
     def predict(self, input_data: Dict) -> Dict:
         """Выполнение предсказания"""
-        return {"prediction": "sample_result"}
\ No newline at end of file
+        return {"prediction": "sample_result"}
+    
+    def predict_batch(self, inputs: List[Dict]) -> List[Dict]:
+        """
+        Предсказание для пачки входов. Если модель загружена и все входы
+        имеют одинаковый набор признаков, вызывается один векторизованный
+        predict по матрице NumPy, иначе - predict для каждого входа.
+        """
+        keys = sorted(inputs[0]) if inputs else []
+        vectorizable = (
+            np is not None
+            and self._model is not None
+            and hasattr(self._model, "predict")
+            and all(sorted(item) == keys for item in inputs)
+        )
+        if not vectorizable:
+            return [self.predict(item) for item in inputs]
+
+        features = np.asarray([[item[key] for key in keys] for item in inputs], dtype=float)
+        predictions = self._model.predict(features)
+        return [{"prediction": np.asarray(row).tolist()} for row in predictions]
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Релей outbox: публикует сообщения из таблицы outbox в RabbitMQ.
+
+Обработчики API пишут задачу, списание и сообщение для брокера одной
+транзакцией, а релей забирает неотправленные строки пачками по
+OUTBOX_BATCH_SIZE, публикует их с подтверждением брокера и помечает
+sent_at. На PostgreSQL строки блокируются FOR UPDATE SKIP LOCKED, поэтому
+можно запускать несколько релеев. Доставка «как минимум один раз»: при
+падении между публикацией и commit сообщение уйдёт повторно.
+
+Запуск: python -m services.outbox_relay
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import delete, select, update
+from database.config import settings
+from database.database import AsyncSessionLocal
+from models.outbox import OutboxMessage
+from services import ledger
+from services.metrics import instrument_database, serve_metrics
+from services.rmq.publisher import get_publisher
+
+logger = logging.getLogger(__name__)
+
+class OutboxRelay:
+    def __init__(self, session_factory=AsyncSessionLocal, publisher=None,
+                 batch_size: int = None, poll_interval: float = None):
+        self.session_factory = session_factory
+        self.publisher = publisher or get_publisher()
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None else settings.OUTBOX_POLL_INTERVAL_MS / 1000
+        self.sent = 0
+
+    def _pending(self, dialect_name: str):
+        stmt = select(OutboxMessage.id, OutboxMessage.routing_key, OutboxMessage.payload)\
+            .where(OutboxMessage.sent_at.is_(None))\
+            .order_by(OutboxMessage.id)\
+            .limit(self.batch_size)
+        if ledger.supports_cte(dialect_name):
+            stmt = stmt.with_for_update(skip_locked=True)
+        return stmt
+
+    async def relay_once(self) -> int:
+        """Публикует одну пачку; возвращает число отправленных сообщений"""
+        async with self.session_factory() as session:
+            rows = (await session.execute(self._pending(ledger.dialect_of(session)))).all()
+            if not rows:
+                return 0
+
+            by_key: Dict[str, List] = defaultdict(list)
+            for row in rows:
+                by_key[row.routing_key].append(row)
+            ids = [row.id for row in rows]
+            try:
+                for routing_key, messages in by_key.items():
+                    await self.publisher.publish_batch(routing_key, [row.payload for row in messages])
+            except Exception as e:
+                # Блокировки снимаются, строки попробует следующий проход
+                await session.rollback()
+                await session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(ids))
+                    .values(attempts=OutboxMessage.attempts + 1, last_error=str(e))
+                )
+                await session.commit()
+                raise
+
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(ids))
+                .values(sent_at=datetime.utcnow(), attempts=OutboxMessage.attempts + 1)
+            )
+            await session.commit()
+        self.sent += len(rows)
+        return len(rows)
+
+    async def purge_sent(self) -> None:
+        """Удаляет отправленные сообщения старше OUTBOX_RETENTION_HOURS"""
+        threshold = datetime.utcnow() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(OutboxMessage).where(OutboxMessage.sent_at < threshold)
+            )
+            await session.commit()
+
+    async def run(self) -> None:
+        logger.info("Outbox relay started: batch=%d, poll=%.3fs", self.batch_size, self.poll_interval)
+        backoff = self.poll_interval
+        last_purge = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                sent = await self.relay_once()
+                backoff = self.poll_interval
+            except Exception:
+                logger.exception("Failed to relay outbox batch")
+                backoff = min(max(backoff * 2, 0.1), 5.0)
+                await asyncio.sleep(backoff)
+                continue
+
+            if loop.time() - last_purge > 3600:
+                last_purge = loop.time()
+                await self.purge_sent()
+            # Полная пачка - вероятно, есть ещё: забираем сразу
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    instrument_database()
+    if settings.WORKER_METRICS_PORT:
+        serve_metrics(settings.WORKER_METRICS_PORT)
+    asyncio.run(OutboxRelay().run())
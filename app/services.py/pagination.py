@@ -0,0 +1,54 @@
+"""
+Keyset-пагинация по (временная метка, id) в порядке убывания.
+
+Курсор - непрозрачная строка с меткой времени и id последней строки
+страницы. Следующая страница начинается строго после неё, поэтому
+стоимость запроса не растёт с номером страницы (в отличие от OFFSET).
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(timestamp: datetime, key: str) -> str:
+    raw = f"{timestamp.isoformat()}|{key}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, key = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), key
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+def paginate(stmt, timestamp_col, key_col, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Добавляет к select сортировку по убыванию, условие курсора и LIMIT"""
+    if cursor:
+        timestamp, key = decode_cursor(cursor)
+        # Сравнение строк (ts, key) < (:ts, :key) - одна граница диапазона по
+        # индексу (..., ts, key); эквивалентный OR индекс ограничить не может
+        stmt = stmt.where(tuple_(timestamp_col, key_col) < tuple_(timestamp, key))
+    stmt = stmt.order_by(timestamp_col.desc(), key_col.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+def next_cursor(rows: Sequence, timestamp_attr: str, key_attr: str, limit: Optional[int]) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница последняя"""
+    if limit is None or len(rows) < limit:
+        return None
+    last = rows[-1]
+    if isinstance(last, dict):
+        timestamp, key = last[timestamp_attr], last[key_attr]
+    else:
+        timestamp, key = getattr(last, timestamp_attr), getattr(last, key_attr)
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return encode_cursor(timestamp, key)
@@ -0,0 +1,75 @@
+"""
+Хеширование паролей bcrypt вне event loop.
+
+bcrypt намеренно медленный (~250 мс при cost=12), поэтому вызовы
+выполняются в отдельном пуле ограниченного размера. Если пул и очередь
+заполнены, новые запросы сразу отклоняются (HasherSaturatedError), а
+не копятся бесконечно.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+import bcrypt
+from database.config import settings
+
+class HasherSaturatedError(Exception):
+    pass
+
+def _hashpw(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _checkpw(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """cost-фактор из хеша вида $2b$12$..."""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    def __init__(self, rounds: int, workers: int, max_queue: int, use_processes: bool = False):
+        self.rounds = rounds
+        self.capacity = workers + max_queue
+        self._executor: Executor = (
+            ProcessPoolExecutor(max_workers=workers) if use_processes
+            else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        )
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise HasherSaturatedError("Password hashing pool is saturated")
+            self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hashpw, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_checkpw, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+@lru_cache()
+def get_password_hasher() -> PasswordHasher:
+    return PasswordHasher(
+        rounds=settings.BCRYPT_ROUNDS,
+        workers=settings.PASSWORD_HASH_WORKERS,
+        max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+        use_processes=settings.PASSWORD_HASH_USE_PROCESSES
+    )
@@ -0,0 +1,118 @@
+"""
+Кэш результатов предсказаний по содержимому входа.
+
+Ключ - хеш канонизированного input_data вместе с model_id, версией и
+статусом модели. Смена версии или статуса даёт новые ключи, поэтому
+устаревшие результаты просто перестают запрашиваться и вытесняются по
+TTL/LRU. Два уровня: in-process TTLCache и необязательный общий Redis
+(PREDICTION_CACHE_REDIS_URL).
+"""
+import hashlib
+import json
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event, inspect, select
+from database.config import settings
+from models.model import BaseMLModel
+from services.cache import TTLCache
+
+# (version, status) моделей: чтобы не читать модель из БД на каждый запрос
+model_info_cache = TTLCache(maxsize=1024, ttl=settings.PREDICTION_CACHE_MODEL_TTL_SECONDS)
+
+def input_fingerprint(input_data: Dict) -> str:
+    canonical = json.dumps(input_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def cache_key(model_id: str, version: int, status: str, input_data: Dict) -> str:
+    return f"pred:{model_id}:{version}:{status}:{input_fingerprint(input_data)}"
+
+def model_cache_key(model: BaseMLModel, input_data: Dict) -> str:
+    return cache_key(model.model_id, model.version, _status_value(model.status), input_data)
+
+def _status_value(status) -> str:
+    return getattr(status, "value", status) or ""
+
+async def aget_model_info(db, model_id: str) -> Optional[Tuple[int, str]]:
+    info = model_info_cache.get(model_id)
+    if info is None:
+        result = await db.execute(
+            select(BaseMLModel.version, BaseMLModel.status).where(BaseMLModel.model_id == model_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        info = (row.version, _status_value(row.status))
+        model_info_cache.set(model_id, info)
+    return info
+
+class RedisBackend:
+    """Общий уровень кэша; redis - необязательная зависимость"""
+
+    def __init__(self, url: str, ttl: int):
+        import redis
+        import redis.asyncio as aioredis
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+        self._async_client = aioredis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, result: Dict) -> None:
+        self._client.set(key, json.dumps(result, default=str), ex=self.ttl)
+
+    async def aget(self, key: str) -> Optional[Dict]:
+        value = await self._async_client.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def aset(self, key: str, result: Dict) -> None:
+        await self._async_client.set(key, json.dumps(result, default=str), ex=self.ttl)
+
+class PredictionCache:
+    def __init__(self, maxsize: int, ttl: int, shared: Optional[RedisBackend] = None):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = shared
+
+    def get(self, key: str) -> Optional[Dict]:
+        result = self.local.get(key)
+        if result is None and self.shared is not None:
+            result = self.shared.get(key)
+            if result is not None:
+                self.local.set(key, result)
+        return result
+
+    def set(self, key: str, result: Dict) -> None:
+        self.local.set(key, result)
+        if self.shared is not None:
+            self.shared.set(key, result)
+
+    async def aget(self, key: str) -> Optional[Dict]:
+        result = self.local.get(key)
+        if result is None and self.shared is not None:
+            result = await self.shared.aget(key)
+            if result is not None:
+                self.local.set(key, result)
+        return result
+
+    async def aset(self, key: str, result: Dict) -> None:
+        self.local.set(key, result)
+        if self.shared is not None:
+            await self.shared.aset(key, result)
+
+@lru_cache()
+def get_prediction_cache() -> PredictionCache:
+    shared = None
+    if settings.PREDICTION_CACHE_REDIS_URL:
+        shared = RedisBackend(settings.PREDICTION_CACHE_REDIS_URL, settings.PREDICTION_CACHE_TTL_SECONDS)
+    return PredictionCache(
+        maxsize=settings.PREDICTION_CACHE_MAXSIZE,
+        ttl=settings.PREDICTION_CACHE_TTL_SECONDS,
+        shared=shared
+    )
+
+@event.listens_for(BaseMLModel, "after_update")
+def _invalidate_model_info(mapper, connection, target: BaseMLModel) -> None:
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("status", "version")):
+        model_info_cache.delete(target.model_id)
@@ -1,8 +1,170 @@
-from typing import Dict, List
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from models.prediction_history import PredictionTask, PredictionStatus
 from models.base_user import BaseUser
 from models.model import BaseMLModel
+from services.archive import AsyncArchiveReader
+from services.pagination import paginate
+from services.scheduling import PriorityClass
+
+STREAM_BATCH_SIZE = 500
+
+HEARTBEAT_EXPIRED_ERROR = "Worker heartbeat expired"
+
+# Статусы, из которых задача может перейти в итоговый
+OPEN_STATUSES = (PredictionStatus.PENDING, PredictionStatus.PROCESSING)
+FINAL_STATUSES = (PredictionStatus.COMPLETED, PredictionStatus.FAILED)
+
+def _open_task(task_id_clause):
+    return update(PredictionTask).where(
+        task_id_clause,
+        PredictionTask.status.in_(OPEN_STATUSES)
+    )
+
+def _finish_task(task_id: str, status: PredictionStatus, result: Optional[Dict] = None,
+                 error: Optional[str] = None):
+    """Один UPDATE вместо SELECT + UPDATE; завершённые задачи не трогаются"""
+    return _open_task(PredictionTask.task_id == task_id)\
+        .values(status=status, result=result, error=error)\
+        .execution_options(synchronize_session=False)
+
+def _claim_tasks(task_ids: List[str], worker_id: str, timeout: timedelta):
+    """
+    Перевод задач в processing; RETURNING - взятые задачи. Берутся задачи
+    в pending и в processing с heartbeat старше timeout (воркер умер до
+    подтверждения сообщения); задачи живого воркера и завершённые - нет.
+    """
+    return update(PredictionTask)\
+        .where(
+            PredictionTask.task_id.in_(task_ids),
+            or_(
+                PredictionTask.status == PredictionStatus.PENDING,
+                and_(
+                    PredictionTask.status == PredictionStatus.PROCESSING,
+                    PredictionTask.heartbeat_at < datetime.utcnow() - timeout
+                )
+            )
+        )\
+        .values(
+            status=PredictionStatus.PROCESSING,
+            worker_id=worker_id,
+            heartbeat_at=datetime.utcnow(),
+            attempts=PredictionTask.attempts + 1
+        )\
+        .returning(PredictionTask.task_id)\
+        .execution_options(synchronize_session=False)
+
+def _heartbeat(worker_id: str):
+    """Один UPDATE на все задачи воркера в обработке"""
+    return update(PredictionTask)\
+        .where(PredictionTask.worker_id == worker_id, PredictionTask.status == PredictionStatus.PROCESSING)\
+        .values(heartbeat_at=datetime.utcnow())\
+        .execution_options(synchronize_session=False)
+
+def _release_tasks(task_ids: List[str], worker_id: str):
+    """Возврат задач воркера из processing в pending"""
+    return update(PredictionTask)\
+        .where(
+            PredictionTask.task_id.in_(task_ids),
+            PredictionTask.worker_id == worker_id,
+            PredictionTask.status == PredictionStatus.PROCESSING
+        )\
+        .values(status=PredictionStatus.PENDING, worker_id=None, heartbeat_at=None)\
+        .execution_options(synchronize_session=False)
+
+def _expired(timeout: timedelta, retry: bool, max_attempts: int):
+    """Задачи с просроченным heartbeat: на повтор (retry) или в failed"""
+    attempts_clause = PredictionTask.attempts < max_attempts if retry else PredictionTask.attempts >= max_attempts
+    stmt = update(PredictionTask).where(
+        PredictionTask.status == PredictionStatus.PROCESSING,
+        PredictionTask.heartbeat_at < datetime.utcnow() - timeout,
+        attempts_clause
+    )
+    if retry:
+        stmt = stmt.values(status=PredictionStatus.PENDING, worker_id=None, heartbeat_at=None)
+    else:
+        stmt = stmt.values(status=PredictionStatus.FAILED, error=HEARTBEAT_EXPIRED_ERROR)
+    return stmt.returning(
+        PredictionTask.task_id, PredictionTask.user_id, PredictionTask.model_id, PredictionTask.input_data,
+        PredictionTask.priority
+    ).execution_options(synchronize_session=False)
+
+def _results_update():
+    """
+    UPDATE для executemany по списку результатов. Меняются только
+    незавершённые задачи, поэтому повторная доставка тех же результатов
+    ничего не делает.
+    """
+    table = PredictionTask.__table__
+    return update(table)\
+        .where(
+            table.c.task_id == bindparam('b_task_id'),
+            # IN с раскрываемыми параметрами несовместим с executemany
+            or_(*(table.c.status == open_status for open_status in OPEN_STATUSES))
+        )\
+        .values(status=bindparam('b_status'), result=bindparam('b_result'), error=bindparam('b_error'))
+
+def _open_task_users(task_ids: List[str]):
+    """task_id -> user_id незавершённых задач; строки блокируются до commit"""
+    return select(PredictionTask.task_id, PredictionTask.user_id)\
+        .where(PredictionTask.task_id.in_(task_ids), PredictionTask.status.in_(OPEN_STATUSES))\
+        .with_for_update()
+
+def _results_params(results: List[Dict]) -> List[Dict]:
+    params = []
+    for item in results:
+        status = PredictionStatus(item['status'])
+        if status not in FINAL_STATUSES:
+            raise ValueError(f"Task {item['task_id']}: status must be completed or failed")
+        params.append({
+            'b_task_id': item['task_id'],
+            'b_status': status,
+            'b_result': item.get('result'),
+            'b_error': item.get('error')
+        })
+    return params
+
+@dataclass(frozen=True, slots=True)
+class PredictionRecord:
+    """Строка истории предсказаний без ORM-объекта и identity map"""
+    task_id: str
+    user_id: str
+    model_id: str
+    input_data: Optional[Dict]
+    status: PredictionStatus
+    created_at: datetime
+    result: Optional[Dict]
+    error: Optional[str]
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "PredictionRecord":
+        """Строка из архивного сегмента (services.archive)"""
+        return cls(
+            task_id=data['task_id'],
+            user_id=data['user_id'],
+            model_id=data['model_id'],
+            input_data=data['input_data'],
+            status=PredictionStatus(data['status']),
+            created_at=datetime.fromisoformat(data['created_at']),
+            result=data['result'],
+            error=data['error']
+        )
+
+# Порядок колонок совпадает с полями PredictionRecord
+PREDICTION_COLUMNS = (
+    PredictionTask.task_id, PredictionTask.user_id, PredictionTask.model_id, PredictionTask.input_data,
+    PredictionTask.status, PredictionTask.created_at, PredictionTask.result, PredictionTask.error
+)
+
+def _history(*criteria):
+    return select(*PREDICTION_COLUMNS).where(*criteria)
+
+history_order = attrgetter('created_at', 'task_id')
 
 class PredictionService:
     def __init__(self, db: Session):
@@ -20,27 +182,204 @@ class PredictionService:
         return task
 
     def complete_task(self, task_id: str, result: Dict) -> None:
-        task = self.db.query(PredictionTask).filter(PredictionTask.task_id == task_id).first()
-        if task:
-            task.status = PredictionStatus.COMPLETED
-            task.result = result
-            self.db.commit()
+        self.db.execute(_finish_task(task_id, PredictionStatus.COMPLETED, result=result))
+        self.db.commit()
 
     def fail_task(self, task_id: str, error: str) -> None:
-        task = self.db.query(PredictionTask).filter(PredictionTask.task_id == task_id).first()
-        if task:
-            task.status = PredictionStatus.FAILED
-            task.error = error
+        self.db.execute(_finish_task(task_id, PredictionStatus.FAILED, error=error))
+        self.db.commit()
+
+    def claim_tasks(self, task_ids: List[str], worker_id: str, timeout: timedelta) -> Set[str]:
+        """Берёт задачи в обработку; возвращает те, что удалось взять"""
+        if not task_ids:
+            return set()
+        claimed = set(self.db.execute(_claim_tasks(task_ids, worker_id, timeout)).scalars())
+        self.db.commit()
+        return claimed
+
+    def heartbeat(self, worker_id: str) -> None:
+        self.db.execute(_heartbeat(worker_id))
+        self.db.commit()
+
+    def release_tasks(self, task_ids: List[str], worker_id: str) -> None:
+        """
+        Возвращает взятые воркером задачи в pending, чтобы повторная
+        доставка их сообщений снова прошла claim_tasks.
+        """
+        if not task_ids:
+            return
+        self.db.execute(_release_tasks(task_ids, worker_id))
+        self.db.commit()
+
+    def reap_expired(self, timeout: timedelta, max_attempts: int, commit: bool = True) -> Tuple[List, List]:
+        """
+        Задачи, воркер которых перестал слать heartbeat: (возвращённые в
+        pending для повторной отправки, переведённые в failed).
+        """
+        requeued = self.db.execute(_expired(timeout, True, max_attempts)).all()
+        failed = self.db.execute(_expired(timeout, False, max_attempts)).all()
+        if commit:
             self.db.commit()
+        return requeued, failed
+
+    def set_results_bulk(self, results: List[Dict]) -> None:
+        """
+        Итоговые статусы пачки задач одним executemany UPDATE.
+        results - словари с ключами task_id, status, result, error.
+        """
+        if not results:
+            return
+        self.db.execute(_results_update(), _results_params(results))
+        self.db.commit()
+
+    def complete_tasks(self, results: Dict[str, Dict]) -> None:
+        """Завершение пачки задач; results - task_id -> result"""
+        self.set_results_bulk([
+            {'task_id': task_id, 'status': PredictionStatus.COMPLETED, 'result': result}
+            for task_id, result in results.items()
+        ])
+
+    def fail_tasks(self, errors: Dict[str, str]) -> None:
+        """Ошибка для пачки задач; errors - task_id -> error"""
+        self.set_results_bulk([
+            {'task_id': task_id, 'status': PredictionStatus.FAILED, 'error': error}
+            for task_id, error in errors.items()
+        ])
+
+    def get_user_history(self, user: BaseUser, limit: Optional[int] = None,
+                         cursor: Optional[str] = None) -> List[PredictionRecord]:
+        stmt = _history(PredictionTask.user_id == user.user_id)
+        result = self.db.execute(
+            paginate(stmt, PredictionTask.created_at, PredictionTask.task_id, limit, cursor)
+        )
+        return [PredictionRecord(*row) for row in result]
+
+    def get_model_history(self, model: BaseMLModel, limit: Optional[int] = None,
+                          cursor: Optional[str] = None) -> List[PredictionRecord]:
+        stmt = _history(PredictionTask.model_id == model.model_id)
+        result = self.db.execute(
+            paginate(stmt, PredictionTask.created_at, PredictionTask.task_id, limit, cursor)
+        )
+        return [PredictionRecord(*row) for row in result]
+
+class AsyncPredictionService:
+    """Асинхронный вариант PredictionService для работы с AsyncSession"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _get_task(self, task_id: str):
+        return await self.db.get(PredictionTask, task_id)
+
+    async def get_task(self, task_id: str) -> Optional[PredictionTask]:
+        return await self._get_task(task_id)
+
+    async def create_task(self, task_data: Dict, commit: bool = True) -> PredictionTask:
+        task = PredictionTask(
+            task_id=task_data['task_id'],
+            user_id=task_data['user_id'],
+            model_id=task_data['model_id'],
+            input_data=task_data['input_data']
+        )
+        self.db.add(task)
+        if commit:
+            await self.db.commit()
+        return task
+
+    async def create_completed_task(self, task_data: Dict, result: Dict, commit: bool = True) -> PredictionTask:
+        """Задача, результат которой уже известен (например, из кэша)"""
+        task = PredictionTask(
+            task_id=task_data['task_id'],
+            user_id=task_data['user_id'],
+            model_id=task_data['model_id'],
+            input_data=task_data['input_data'],
+            status=PredictionStatus.COMPLETED,
+            result=result
+        )
+        self.db.add(task)
+        if commit:
+            await self.db.commit()
+        return task
+
+    async def create_tasks(self, user_id: str, model_id: str, tasks: List[Tuple[str, Dict]],
+                           commit: bool = True, priority: PriorityClass = PriorityClass.INTERACTIVE) -> None:
+        """Вставка пачки задач одним оператором; tasks - пары (task_id, input_data)"""
+        await self.db.execute(insert(PredictionTask), [
+            {
+                'task_id': task_id,
+                'user_id': user_id,
+                'model_id': model_id,
+                'input_data': input_data,
+                'status': PredictionStatus.PENDING,
+                'priority': priority.value
+            }
+            for task_id, input_data in tasks
+        ])
+        if commit:
+            await self.db.commit()
+
+    async def complete_task(self, task_id: str, result: Dict) -> None:
+        await self.db.execute(_finish_task(task_id, PredictionStatus.COMPLETED, result=result))
+        await self.db.commit()
+
+    async def fail_task(self, task_id: str, error: str) -> None:
+        await self.db.execute(_finish_task(task_id, PredictionStatus.FAILED, error=error))
+        await self.db.commit()
+
+    async def set_results_bulk(self, results: List[Dict]) -> List[Tuple[Dict, Optional[str]]]:
+        """
+        Итоговые статусы пачки задач одним executemany UPDATE (идемпотентно).
+        Возвращает применённые результаты с user_id задачи; уже завершённые
+        задачи и повторы task_id в пачке не меняются и не возвращаются.
+        """
+        if not results:
+            return []
+        params = _results_params(results)
+        open_tasks = dict((await self.db.execute(
+            _open_task_users([item['task_id'] for item in results])
+        )).all())
+        await self.db.execute(_results_update(), params)
+        await self.db.commit()
+        applied = []
+        for item in results:
+            if item['task_id'] in open_tasks:
+                applied.append((item, open_tasks.pop(item['task_id'])))
+        return applied
+
+    async def get_user_history(self, user: BaseUser, limit: Optional[int] = None,
+                               cursor: Optional[str] = None) -> List[PredictionRecord]:
+        stmt = _history(PredictionTask.user_id == user.user_id)
+        result = await self.db.execute(
+            paginate(stmt, PredictionTask.created_at, PredictionTask.task_id, limit, cursor)
+        )
+        hot = [PredictionRecord(*row) for row in result]
+        return await AsyncArchiveReader(self.db).merge_page(
+            PredictionTask.__tablename__, user.user_id, hot, limit, cursor, PredictionRecord.from_json, history_order
+        )
+
+    async def get_model_history(self, model: BaseMLModel, limit: Optional[int] = None,
+                                cursor: Optional[str] = None) -> List[PredictionRecord]:
+        """
+        Только горячая таблица: архивные сегменты разбиты по пользователям,
+        и страница модели потребовала бы читать сегменты всех её
+        пользователей. Задачи, перенесённые в архив, здесь не видны.
+        """
+        stmt = _history(PredictionTask.model_id == model.model_id)
+        result = await self.db.execute(
+            paginate(stmt, PredictionTask.created_at, PredictionTask.task_id, limit, cursor)
+        )
+        return [PredictionRecord(*row) for row in result]
 
-    def get_user_history(self, user: BaseUser) -> List[PredictionTask]:
-        return self.db.query(PredictionTask)\
-            .filter(PredictionTask.user_id == user.user_id)\
-            .order_by(PredictionTask.created_at.desc())\
-            .all()
-
-    def get_model_history(self, model: BaseMLModel) -> List[PredictionTask]:
-        return self.db.query(PredictionTask)\
-            .filter(PredictionTask.model_id == model.model_id)\
-            .order_by(PredictionTask.created_at.desc())\
-            .all()
\ No newline at end of file
+    async def stream_user_history(self, user_id: str) -> AsyncIterator[PredictionRecord]:
+        """Вся история пользователя через серверный курсор, пачками по STREAM_BATCH_SIZE, затем архив"""
+        stmt = paginate(
+            _history(PredictionTask.user_id == user_id),
+            PredictionTask.created_at, PredictionTask.task_id
+        ).execution_options(yield_per=STREAM_BATCH_SIZE)
+        result = await self.db.stream(stmt)
+        async for row in result:
+            yield PredictionRecord(*row)
+        async for record in AsyncArchiveReader(self.db).stream(
+            PredictionTask.__tablename__, user_id, PredictionRecord.from_json
+        ):
+            yield record
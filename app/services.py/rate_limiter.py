@@ -0,0 +1,123 @@
+"""
+Ограничение частоты запросов пользователей (token bucket).
+
+У каждого пользователя своё ведро: ёмкость burst, пополнение rate
+токенов в секунду. Параметры зависят от роли. По умолчанию вёдра живут в
+памяти процесса; с RATE_LIMIT_REDIS_URL используется общий Redis, и
+лимит действует на все процессы API сразу.
+"""
+import math
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+from database.config import settings
+from models.base_user import UserRole
+
+# (rate в секунду, burst); rate == 0 - без ограничения
+Limit = Tuple[float, int]
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+class LocalBackend:
+    def __init__(self, clock: Callable[[], float] = time.monotonic, max_buckets: int = 100000):
+        self._clock = clock
+        self._max_buckets = max_buckets
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, limit: Limit, cost: float = 1) -> float:
+        """0, если токены списаны, иначе через сколько секунд их хватит"""
+        rate, burst = limit
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self._max_buckets:
+                    self._drop_full(now)
+                bucket = self._buckets[key] = TokenBucket(burst, now)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return 0.0
+            return (cost - bucket.tokens) / rate
+
+    def _drop_full(self, now: float) -> None:
+        # Вёдра неактивных пользователей давно полны - их можно забыть
+        idle = [key for key, bucket in self._buckets.items() if now - bucket.updated_at > 60]
+        for key in idle or list(self._buckets)[:len(self._buckets) // 2]:
+            del self._buckets[key]
+
+class RedisBackend:
+    """Общие вёдра в Redis; redis - необязательная зависимость"""
+
+    # Пополнение и списание одним скриптом, атомарно для всех процессов
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as aioredis
+        self._client = aioredis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1) -> float:
+        rate, burst = limit
+        wait = await self._script(keys=[f"ratelimit:{key}"], args=[rate, burst, cost, time.time()])
+        return float(wait)
+
+class RateLimiter:
+    def __init__(self, limits: Dict[UserRole, Limit], backend=None):
+        self.limits = limits
+        self.backend = backend or LocalBackend()
+        self._shared = not isinstance(self.backend, LocalBackend)
+        self.rejected = 0
+
+    async def acquire(self, user_id: str, role: UserRole, cost: float = 1) -> float:
+        """0, если запрос пропущен, иначе рекомендуемый Retry-After в секундах"""
+        limit = self.limits.get(role)
+        if limit is None or limit[0] <= 0:
+            return 0.0
+        if self._shared:
+            wait = await self.backend.acquire(user_id, limit, cost)
+        else:
+            wait = self.backend.acquire(user_id, limit, cost)
+        if wait:
+            self.rejected += 1
+        return wait
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    backend: Optional[RedisBackend] = None
+    if settings.RATE_LIMIT_REDIS_URL:
+        backend = RedisBackend(settings.RATE_LIMIT_REDIS_URL)
+    return RateLimiter({
+        UserRole.ADMIN: (settings.RATE_LIMIT_ADMIN_PER_SECOND, settings.RATE_LIMIT_ADMIN_BURST),
+        UserRole.REGULAR: (settings.RATE_LIMIT_REGULAR_PER_SECOND, settings.RATE_LIMIT_REGULAR_BURST),
+        UserRole.MODEL_OWNER: (settings.RATE_LIMIT_MODEL_OWNER_PER_SECOND, settings.RATE_LIMIT_MODEL_OWNER_BURST),
+    }, backend)
@@ -0,0 +1,82 @@
+"""
+Асинхронный RPC-клиент поверх RabbitMQ.
+
+Все вызовы процесса используют одно соединение и одну эксклюзивную
+очередь ответов. Ответ сопоставляется с ожидающим вызовом по
+correlation_id, поэтому много запросов могут выполняться одновременно,
+не блокируя event loop.
+"""
+import asyncio
+import uuid
+from typing import Dict, Optional
+import aio_pika
+from database.config import settings
+
+class AsyncRpcClient:
+    def __init__(self, url: str, routing_key: str, timeout: float = 30.0):
+        self.url = url
+        self.routing_key = routing_key
+        self.timeout = timeout
+        self._connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self._reply_queue: Optional[aio_pika.abc.AbstractQueue] = None
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+
+    async def _ensure_connected(self) -> None:
+        if self._reply_queue is not None:
+            return
+        async with self._lock:
+            if self._reply_queue is not None:
+                return
+            self._connection = await aio_pika.connect_robust(self.url)
+            self._channel = await self._connection.channel()
+            queue = await self._channel.declare_queue(exclusive=True, auto_delete=True)
+            await queue.consume(self._on_response, no_ack=True)
+            self._reply_queue = queue
+
+    async def _on_response(self, message: aio_pika.abc.AbstractIncomingMessage) -> None:
+        future = self._futures.get(message.correlation_id)
+        # Ответ на вызов, который уже отменён или истёк по таймауту, отбрасываем
+        if future is not None and not future.done():
+            future.set_result(message.body.decode("utf-8"))
+
+    async def call(self, text: str, timeout: Optional[float] = None) -> str:
+        """Отправляет запрос и ждёт ответ; asyncio.TimeoutError по истечении timeout"""
+        await self._ensure_connected()
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._futures[correlation_id] = future
+        try:
+            await self._channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=text.encode("utf-8"),
+                    correlation_id=correlation_id,
+                    reply_to=self._reply_queue.name
+                ),
+                routing_key=self.routing_key
+            )
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            # И при ответе, и при таймауте, и при отмене запроса клиентом
+            self._futures.pop(correlation_id, None)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._futures)
+
+    async def close(self) -> None:
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._connection is not None:
+            await self._connection.close()
+        self._connection = self._channel = self._reply_queue = None
+
+_rpc_client: Optional[AsyncRpcClient] = None
+
+def get_rpc_client() -> AsyncRpcClient:
+    global _rpc_client
+    if _rpc_client is None:
+        _rpc_client = AsyncRpcClient(settings.RABBITMQ_URL, settings.RPC_QUEUE, settings.RPC_TIMEOUT_SECONDS)
+    return _rpc_client
@@ -0,0 +1,43 @@
+"""
+In-memory заменитель RabbitMQ для тестов и бенчмарков.
+
+InMemoryPublisher повторяет интерфейс RabbitPublisher, а сообщения
+складываются в очереди InMemoryBroker в том же процессе.
+"""
+import json
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+from services.rmq.publisher import encode_message
+
+class InMemoryBroker:
+    def __init__(self):
+        self.queues: Dict[str, Deque[Dict]] = defaultdict(deque)
+
+    def put(self, routing_key: str, body: bytes, priority: Optional[int] = None) -> None:
+        self.queues[routing_key].append({"body": body, "priority": priority})
+
+    def get(self, routing_key: str) -> Optional[Dict]:
+        queue = self.queues.get(routing_key)
+        if not queue:
+            return None
+        envelope = queue.popleft()
+        return json.loads(envelope["body"])
+
+    def depth(self, routing_key: str) -> int:
+        return len(self.queues.get(routing_key, ()))
+
+class InMemoryPublisher:
+    def __init__(self, broker: Optional[InMemoryBroker] = None):
+        self.broker = broker or InMemoryBroker()
+
+    async def publish(self, routing_key: str, message: Dict, priority: Optional[int] = None) -> None:
+        await self.publish_batch(routing_key, [message], priority=priority)
+
+    async def publish_batch(self, routing_key: str, messages: List[Dict],
+                            priority: Optional[int] = None, exchange: Optional[str] = None) -> None:
+        # Сообщения fanout-exchange складываются в очередь с его именем
+        for message in messages:
+            self.broker.put(exchange or routing_key, encode_message(message), priority)
+
+    async def close(self) -> None:
+        pass
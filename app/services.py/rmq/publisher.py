@@ -0,0 +1,116 @@
+"""
+Долгоживущий издатель RabbitMQ, общий для всего процесса.
+
+Одно robust-соединение (aio-pika сам переподключается после обрыва)
+и пул каналов с publisher confirms. Пакет сообщений публикуется
+конкурентно в одном канале, поэтому подтверждения всего пакета
+приходят примерно за один round-trip.
+"""
+import asyncio
+import json
+from typing import Dict, Iterable, List, Optional
+import aio_pika
+from aio_pika.pool import Pool
+from database.config import settings
+from services.metrics import broker_messages, broker_publish_latency
+
+PREDICTION_QUEUE = "model_predictions"
+
+def encode_message(message: Dict) -> bytes:
+    return json.dumps(message, default=str).encode("utf-8")
+
+class RabbitPublisher:
+    def __init__(self, url: str, pool_size: int = 8, queues: Iterable[str] = (PREDICTION_QUEUE,)):
+        self.url = url
+        self.pool_size = pool_size
+        self.queues = tuple(queues)
+        self._connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._channels: Optional[Pool] = None
+        self._lock = asyncio.Lock()
+        self._declared = set(self.queues)
+        self._exchanges = set()
+
+    async def _new_channel(self) -> aio_pika.abc.AbstractChannel:
+        channel = await self._connection.channel(publisher_confirms=True)
+        for queue in self.queues:
+            await channel.declare_queue(queue, durable=True)
+        return channel
+
+    async def _channel_pool(self) -> Pool:
+        if self._channels is None:
+            async with self._lock:
+                if self._channels is None:
+                    self._connection = await aio_pika.connect_robust(self.url)
+                    self._channels = Pool(self._new_channel, max_size=self.pool_size)
+        return self._channels
+
+    async def publish(self, routing_key: str, message: Dict, priority: Optional[int] = None) -> None:
+        await self.publish_batch(routing_key, [message], priority=priority)
+
+    async def publish_batch(self, routing_key: str, messages: List[Dict],
+                            priority: Optional[int] = None, exchange: Optional[str] = None) -> None:
+        """
+        Публикует все сообщения и ждёт подтверждения брокера для каждого.
+        exchange - fanout-exchange вместо очереди по умолчанию.
+        """
+        if not messages:
+            return
+        pool = await self._channel_pool()
+        with broker_publish_latency.time(routing_key):
+            await self._publish(pool, routing_key, messages, priority, exchange)
+        broker_messages.inc(routing_key, "published", amount=len(messages))
+
+    async def _publish(self, pool: Pool, routing_key: str, messages: List[Dict],
+                       priority: Optional[int], exchange: Optional[str]) -> None:
+        async with pool.acquire() as channel:
+            if exchange:
+                if exchange not in self._exchanges:
+                    await channel.declare_exchange(exchange, aio_pika.ExchangeType.FANOUT, durable=True)
+                    self._exchanges.add(exchange)
+                target = await channel.get_exchange(exchange, ensure=False)
+            else:
+                # Очереди по моделям заранее неизвестны: объявляем при первой публикации
+                if routing_key not in self._declared:
+                    await channel.declare_queue(routing_key, durable=True)
+                    self._declared.add(routing_key)
+                target = channel.default_exchange
+            await asyncio.gather(*(
+                target.publish(
+                    aio_pika.Message(
+                        body=encode_message(message),
+                        content_type="application/json",
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        priority=priority
+                    ),
+                    routing_key=routing_key
+                )
+                for message in messages
+            ))
+
+    async def close(self) -> None:
+        if self._channels is not None:
+            await self._channels.close()
+            self._channels = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+_publisher = None
+
+def get_publisher():
+    """Издатель процесса; создаётся при первом обращении"""
+    global _publisher
+    if _publisher is None:
+        _publisher = RabbitPublisher(settings.RABBITMQ_URL, pool_size=settings.RABBITMQ_CHANNEL_POOL_SIZE)
+    return _publisher
+
+def set_publisher(publisher) -> None:
+    """Подменяет издатель процесса (например, на InMemoryPublisher)"""
+    global _publisher
+    _publisher = publisher
+
+async def close_publisher() -> None:
+    global _publisher
+    if _publisher is not None:
+        await _publisher.close()
+        _publisher = None
@@ -0,0 +1,83 @@
+"""
+Классы приоритета и справедливое распределение задач предсказаний.
+
+Интерактивные (одиночные) и пакетные задачи идут в разные очереди, у
+каждой очереди свой consumer и своё окно prefetch, поэтому большой
+пакет не занимает всё окно воркера. Внутри воркера FairScheduler
+выбирает следующую задачу взвешенным round-robin между классами и
+обычным round-robin между пользователями.
+"""
+from collections import OrderedDict, deque
+from enum import Enum
+from itertools import cycle
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from database.config import settings
+from services.rmq.publisher import PREDICTION_QUEUE
+
+class PriorityClass(str, Enum):
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+def queue_name(priority: PriorityClass, model_id: Optional[str] = None) -> str:
+    """
+    Имя очереди для класса и модели. Интерактивная очередь без выделения
+    моделей - прежняя model_predictions.
+    """
+    name = PREDICTION_QUEUE
+    if model_id and settings.PREDICTION_PER_MODEL_QUEUES:
+        name = f"{name}.{model_id}"
+    if priority == PriorityClass.BULK:
+        name = f"{name}.bulk"
+    return name
+
+def worker_queues() -> List[Tuple[PriorityClass, str]]:
+    """Очереди, которые слушает воркер: по две на каждую модель из WORKER_MODEL_IDS"""
+    model_ids = [m.strip() for m in settings.WORKER_MODEL_IDS.split(",") if m.strip()]
+    if not settings.PREDICTION_PER_MODEL_QUEUES or not model_ids:
+        model_ids = [None]
+    return [
+        (priority, queue_name(priority, model_id))
+        for model_id in model_ids
+        for priority in PriorityClass
+    ]
+
+class FairScheduler:
+    def __init__(self, weights: Dict[PriorityClass, int]):
+        # Например {INTERACTIVE: 4, BULK: 1}: из пяти выборок четыре интерактивные
+        self._order = cycle([priority for priority, weight in weights.items() for _ in range(weight)])
+        self._slots = sum(weights.values())
+        self._pending: Dict[PriorityClass, "OrderedDict[Any, Deque]"] = {
+            priority: OrderedDict() for priority in weights
+        }
+        self._size = 0
+
+    def add(self, priority: PriorityClass, user_id: Any, item: Any) -> None:
+        users = self._pending[priority]
+        if user_id not in users:
+            users[user_id] = deque()
+        users[user_id].append(item)
+        self._size += 1
+
+    def pop(self) -> Optional[Any]:
+        if not self._size:
+            return None
+        for _ in range(self._slots):
+            users = self._pending[next(self._order)]
+            if not users:
+                continue
+            # Первый пользователь в очереди отдаёт одну задачу и уходит в конец
+            user_id, items = next(iter(users.items()))
+            item = items.popleft()
+            if items:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            self._size -= 1
+            return item
+        return None
+
+    def depth(self, priority: PriorityClass) -> int:
+        return sum(len(items) for items in self._pending[priority].values())
+
+    def __len__(self) -> int:
+        return self._size
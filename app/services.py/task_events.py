@@ -0,0 +1,109 @@
+"""
+События завершения задач для push-доставки клиентам.
+
+Воркер после записи результатов (и API после приёма результатов
+пачкой) публикует события в fanout-exchange task_events. Каждый
+API-процесс слушает exchange своей эксклюзивной очередью и раздаёт
+события подписчикам (SSE, long-poll) через TaskEventHub - без опроса БД.
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set
+import aio_pika
+from database.config import settings
+from services.rmq.publisher import get_publisher
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENTS_EXCHANGE = "task_events"
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+def build_task_event(task_id: str, user_id: Optional[str], status: str,
+                     result: Optional[Dict] = None, error: Optional[str] = None) -> Dict:
+    return {
+        'task_id': task_id,
+        'user_id': user_id,
+        'status': status,
+        'result': result,
+        'error': error
+    }
+
+async def publish_task_events(events: List[Dict]) -> None:
+    """Публикует события через издатель процесса"""
+    await get_publisher().publish_batch(TASK_EVENTS_EXCHANGE, events, exchange=TASK_EVENTS_EXCHANGE)
+
+class TaskEventHub:
+    def __init__(self):
+        self._by_task: Dict[str, Set[asyncio.Queue]] = {}
+        self._by_user: Dict[str, Set[asyncio.Queue]] = {}
+
+    @asynccontextmanager
+    async def subscription(self, task_id: Optional[str] = None,
+                           user_id: Optional[str] = None) -> AsyncIterator[asyncio.Queue]:
+        """Очередь событий одной задачи или всех задач пользователя"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        index, key = (self._by_task, task_id) if task_id else (self._by_user, user_id)
+        index.setdefault(key, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = index.get(key)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del index[key]
+
+    def dispatch(self, event: Dict) -> None:
+        targets = set(self._by_task.get(event.get('task_id'), ()))
+        targets |= self._by_user.get(event.get('user_id'), set())
+        for queue in targets:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Медленный подписчик не должен задерживать остальных
+                logger.warning("Dropping task event for a slow subscriber: %s", event.get('task_id'))
+
+class TaskEventListener:
+    def __init__(self, url: str, hub: TaskEventHub):
+        self.url = url
+        self.hub = hub
+        self._connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self._connection is not None:
+            return
+        async with self._lock:
+            if self._connection is not None:
+                return
+            connection = await aio_pika.connect_robust(self.url)
+            channel = await connection.channel()
+            exchange = await channel.declare_exchange(TASK_EVENTS_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True)
+            queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+            await queue.bind(exchange)
+            await queue.consume(self._on_event, no_ack=True)
+            self._connection = connection
+
+    async def _on_event(self, message: aio_pika.abc.AbstractIncomingMessage) -> None:
+        try:
+            self.hub.dispatch(json.loads(message.body))
+        except ValueError:
+            logger.error("Malformed task event: %r", message.body)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+task_event_hub = TaskEventHub()
+_listener: Optional[TaskEventListener] = None
+
+async def get_task_event_hub() -> TaskEventHub:
+    """Хаб процесса; слушатель RabbitMQ запускается при первом подписчике"""
+    global _listener
+    if _listener is None:
+        _listener = TaskEventListener(settings.RABBITMQ_URL, task_event_hub)
+    await _listener.start()
+    return task_event_hub
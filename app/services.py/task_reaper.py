@@ -0,0 +1,109 @@
+"""
+Подбор задач, воркер которых перестал слать heartbeat.
+
+Задача в processing с heartbeat_at старше TASK_HEARTBEAT_TIMEOUT_SECONDS
+возвращается в pending и заново отправляется через outbox в очередь
+своего класса приоритета, а после TASK_MAX_ATTEMPTS попыток переводится
+в failed; о таких задачах после commit публикуются события task_events.
+Статусы меняются условными UPDATE ... RETURNING, поэтому несколько
+reaper'ов не переотправят одну задачу дважды.
+
+Запуск: python -m services.task_reaper
+"""
+import logging
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List
+import pika
+from sqlalchemy import insert
+from database.config import settings
+from database.database import SessionLocal
+from models.outbox import OutboxMessage
+from services.idempotency import IdempotencyService
+from services.model_services import ModelService
+from services.prediction_services import HEARTBEAT_EXPIRED_ERROR, PredictionService
+from services.rmq.publisher import encode_message
+from services.scheduling import PriorityClass, queue_name
+from services.task_events import TASK_EVENTS_EXCHANGE, build_task_event
+
+logger = logging.getLogger(__name__)
+
+def publish_task_events(events: List[Dict]) -> None:
+    """Публикация событий в task_events; задачи в failed - редкость, соединение не держим"""
+    connection = pika.BlockingConnection(pika.URLParameters(settings.RABBITMQ_URL))
+    try:
+        channel = connection.channel()
+        channel.exchange_declare(exchange=TASK_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+        for event in events:
+            channel.basic_publish(exchange=TASK_EVENTS_EXCHANGE, routing_key='', body=encode_message(event))
+    finally:
+        connection.close()
+
+class TaskReaper:
+    def __init__(self, session_factory=SessionLocal,
+                 publish_events: Callable[[List[Dict]], None] = publish_task_events):
+        self.session_factory = session_factory
+        self.publish_events = publish_events
+        self.timeout = timedelta(seconds=settings.TASK_HEARTBEAT_TIMEOUT_SECONDS)
+        self.max_attempts = settings.TASK_MAX_ATTEMPTS
+
+    def reap_once(self):
+        session = self.session_factory()
+        try:
+            requeued, failed = PredictionService(session).reap_expired(
+                self.timeout, self.max_attempts, commit=False
+            )
+            if requeued:
+                session.execute(insert(OutboxMessage), [
+                    {
+                        'routing_key': queue_name(PriorityClass(row.priority), row.model_id),
+                        'payload': ModelService.build_prediction_message(
+                            row.task_id, row.model_id, row.input_data, row.user_id
+                        )
+                    }
+                    for row in requeued
+                ])
+            session.commit()
+        finally:
+            session.close()
+        if requeued or failed:
+            logger.warning("Expired tasks: %d requeued, %d failed", len(requeued), len(failed))
+        if failed:
+            try:
+                self.publish_events([
+                    build_task_event(row.task_id, row.user_id, "failed", error=HEARTBEAT_EXPIRED_ERROR)
+                    for row in failed
+                ])
+            except Exception:
+                # Статус уже в БД: long-poll и история увидят его без события
+                logger.exception("Failed to publish events for %d failed tasks", len(failed))
+        return requeued, failed
+
+    def purge_idempotency_keys(self) -> None:
+        """Заодно удаляет просроченные ключи идемпотентности"""
+        session = self.session_factory()
+        try:
+            purged = IdempotencyService(session).purge_expired()
+            if purged:
+                logger.info("Purged %d expired idempotency keys", purged)
+        except Exception:
+            logger.exception("Failed to purge idempotency keys")
+        finally:
+            session.close()
+
+    def run(self) -> None:
+        logger.info("Task reaper started: timeout=%s, max_attempts=%d", self.timeout, self.max_attempts)
+        last_purge = 0.0
+        while True:
+            try:
+                self.reap_once()
+            except Exception:
+                logger.exception("Failed to reap expired tasks")
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                self.purge_idempotency_keys()
+            time.sleep(settings.TASK_REAPER_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    TaskReaper().run()
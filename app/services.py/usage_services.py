@@ -0,0 +1,69 @@
+"""
+Сводки расходов и пополнений по агрегату usage_daily.
+
+Агрегат обновляется в транзакции списания/пополнения (services.ledger),
+поэтому сводка читает по строке на день, модель и тип операции, а не
+всю историю transactions.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models.balance import TransactionType
+from models.usage import UsageDaily
+
+DEFAULT_SUMMARY_DAYS = 30
+
+def _period(since: Optional[date], until: Optional[date]):
+    until = until or datetime.utcnow().date()
+    since = since or until - timedelta(days=DEFAULT_SUMMARY_DAYS - 1)
+    return since, until
+
+def _summary_query(user_id: str, since: date, until: date):
+    return select(UsageDaily.day, UsageDaily.model_id, UsageDaily.type, UsageDaily.amount, UsageDaily.count)\
+        .where(UsageDaily.user_id == user_id, UsageDaily.day >= since, UsageDaily.day <= until)\
+        .order_by(UsageDaily.day)
+
+def _build_summary(rows: Iterable, since: date, until: date) -> Dict:
+    totals = defaultdict(lambda: {'amount': Decimal('0'), 'count': 0})
+    by_model = defaultdict(lambda: {'amount': Decimal('0'), 'count': 0})
+    by_day = defaultdict(lambda: {'amount': Decimal('0'), 'count': 0})
+    for row in rows:
+        tx_type = TransactionType(row.type).value
+        for bucket in (totals[tx_type], by_day[(row.day, tx_type)]):
+            bucket['amount'] += row.amount
+            bucket['count'] += row.count
+        if row.model_id and row.type == TransactionType.WITHDRAWAL:
+            by_model[row.model_id]['amount'] += row.amount
+            by_model[row.model_id]['count'] += row.count
+    return {
+        'since': since,
+        'until': until,
+        'totals': [{'type': tx_type, **values} for tx_type, values in totals.items()],
+        'by_model': [{'model_id': model_id, **values} for model_id, values in by_model.items()],
+        'by_day': [{'day': day, 'type': tx_type, **values} for (day, tx_type), values in by_day.items()]
+    }
+
+class UsageService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_summary(self, user_id: str, since: Optional[date] = None, until: Optional[date] = None) -> Dict:
+        since, until = _period(since, until)
+        rows = self.db.execute(_summary_query(user_id, since, until)).all()
+        return _build_summary(rows, since, until)
+
+class AsyncUsageService:
+    """Асинхронный вариант UsageService для работы с AsyncSession"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_summary(self, user_id: str, since: Optional[date] = None,
+                          until: Optional[date] = None) -> Dict:
+        since, until = _period(since, until)
+        result = await self.db.execute(_summary_query(user_id, since, until))
+        return _build_summary(result.all(), since, until)
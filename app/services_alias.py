@@ -0,0 +1,25 @@
+"""
+Каталог пакета сервисов называется services.py, а импортируется как
+services. Если services не находится на sys.path, register_services
+регистрирует пакет по пути. Импортируют тесты (tests/conftest.py) и
+бенчмарки (benchmarks/__init__.py), которые запускаются из каталога app.
+"""
+import importlib.util
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def register_services() -> None:
+    try:
+        if importlib.util.find_spec("services") is not None:
+            return
+    except ImportError:
+        pass
+    package_dir = os.path.join(APP_DIR, "services.py")
+    spec = importlib.util.spec_from_file_location(
+        "services", os.path.join(package_dir, "__init__.py"), submodule_search_locations=[package_dir]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["services"] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,45 @@
+"""
+Импорты для тестов: каталог app в sys.path, как PYTHONPATH=/app в
+контейнере; пакет services регистрирует services_alias.
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# Модели импортируют database.database, которому нужны настройки БД
+for _key, _value in {"DB_HOST": "localhost", "DB_PORT": "5432", "DB_USER": "user",
+                     "DB_PASS": "password", "DB_NAME": "mydb"}.items():
+    os.environ.setdefault(_key, _value)
+
+from services_alias import register_services  # noqa: E402
+
+register_services()
+
+from database.database import run_migrations  # noqa: E402
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """Путь к файлу SQLite со схемой из миграций"""
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        run_migrations(conn)
+    engine.dispose()
+    return path
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def async_session_factory(sqlite_db):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{sqlite_db}")
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+    await engine.dispose()
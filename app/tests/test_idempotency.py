@@ -0,0 +1,89 @@
+"""POST /balance/deposit с Idempotency-Key: повтор, чужое тело, параллельный повтор"""
+from decimal import Decimal
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import func, select
+
+from api.dependencies import get_current_user
+from api.routers import balance
+from database.database import get_async_session
+from models.balance import Balance, Transaction
+from models.base_user import BaseUser, UserRole
+from services.auth_services import UserPrincipal
+from services.balance_services import forget_insufficient
+from services.idempotency import AsyncIdempotencyService, stored_responses
+
+pytestmark = pytest.mark.anyio
+
+USER = UserPrincipal(user_id="user", username="user", role=UserRole.REGULAR, is_active=True)
+
+@pytest.fixture
+async def client(async_session_factory):
+    async with async_session_factory() as db:
+        db.add(BaseUser(user_id="user", username="user", email="user@example.com",
+                        password_hash="", role=UserRole.REGULAR))
+        await db.commit()
+
+    app = FastAPI()
+    app.include_router(balance.router)
+
+    async def session():
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_session] = session
+    app.dependency_overrides[get_current_user] = lambda: USER
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    stored_responses.clear()
+    forget_insufficient("user")
+
+async def _state(async_session_factory):
+    async with async_session_factory() as db:
+        return (
+            await db.scalar(select(Balance.amount).where(Balance.user_id == "user")),
+            await db.scalar(select(func.count()).select_from(Transaction)),
+        )
+
+async def _deposit(client, amount: str, key: str = "key") -> httpx.Response:
+    return await client.post("/balance/deposit", data={'amount': amount}, headers={"Idempotency-Key": key})
+
+async def test_replay_deposits_once(client, async_session_factory):
+    assert (await _deposit(client, "10")).status_code == 303
+    assert (await _deposit(client, "10")).status_code == 303
+    # Повтор после перезапуска процесса: ключ находится в БД
+    stored_responses.clear()
+    assert (await _deposit(client, "10")).status_code == 303
+    assert await _state(async_session_factory) == (Decimal("10"), 1)
+
+    # Другой ключ - новое пополнение
+    assert (await _deposit(client, "10", key="other")).status_code == 303
+    assert await _state(async_session_factory) == (Decimal("20"), 2)
+
+async def test_reused_key_with_different_body(client, async_session_factory):
+    assert (await _deposit(client, "10")).status_code == 303
+    response = await _deposit(client, "20")
+    assert response.status_code == 422
+    assert await _state(async_session_factory) == (Decimal("10"), 1)
+
+async def test_concurrent_retry_loses_on_primary_key(client, async_session_factory, monkeypatch):
+    assert (await _deposit(client, "10")).status_code == 303
+
+    # Второй запрос проверял ключ до commit первого и ничего не нашёл
+    lookup = AsyncIdempotencyService.lookup
+    calls = []
+
+    async def missed_once(self, user_id, key, request_hash):
+        calls.append(key)
+        if len(calls) == 1:
+            return None
+        return await lookup(self, user_id, key, request_hash)
+
+    monkeypatch.setattr(AsyncIdempotencyService, "lookup", missed_once)
+    stored_responses.clear()
+    assert (await _deposit(client, "10")).status_code == 303
+    assert len(calls) == 2
+    assert await _state(async_session_factory) == (Decimal("10"), 1)
@@ -0,0 +1,71 @@
+"""Баланс: конкурентные списания и отказ при нехватке средств"""
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from models.balance import Balance, Transaction
+from models.base_user import BaseUser, UserRole
+from models.usage import UsageDaily
+from services.balance_services import BalanceService, InsufficientFundsError, forget_insufficient
+
+USER_ID = "user"
+
+def _engine(path):
+    # timeout: ожидание блокировки файла вместо немедленной ошибки
+    return create_engine(f"sqlite:///{path}", connect_args={"timeout": 60})
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    engine = _engine(sqlite_db)
+    factory = sessionmaker(bind=engine)
+    with factory() as session:
+        session.add(BaseUser(user_id=USER_ID, username=USER_ID, email="user@example.com",
+                             password_hash="", role=UserRole.REGULAR))
+        session.commit()
+        BalanceService(session).deposit(session.get(BaseUser, USER_ID), Decimal("10"), "initial")
+    yield factory
+    engine.dispose()
+    forget_insufficient(USER_ID)
+
+def _state(session_factory):
+    with session_factory() as session:
+        return (
+            session.scalar(select(Balance.amount).where(Balance.user_id == USER_ID)),
+            session.scalar(select(func.count()).select_from(Transaction)),
+            session.execute(select(UsageDaily.type, UsageDaily.amount, UsageDaily.count)).all(),
+        )
+
+def test_concurrent_withdraw_never_overdraws(sqlite_db, session_factory):
+    def withdraw_all(_):
+        engine = _engine(sqlite_db)
+        succeeded = 0
+        with sessionmaker(bind=engine)() as session:
+            service = BalanceService(session)
+            for _ in range(5):
+                try:
+                    service.withdraw(USER_ID, Decimal("1"), "test")
+                    succeeded += 1
+                except InsufficientFundsError:
+                    session.rollback()
+        engine.dispose()
+        return succeeded
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        succeeded = sum(pool.map(withdraw_all, range(4)))
+
+    balance, transactions, _ = _state(session_factory)
+    assert succeeded == 10
+    assert balance == Decimal("0")
+    # Пополнение и успешные списания
+    assert transactions == 1 + succeeded
+
+def test_insufficient_funds_changes_nothing(session_factory):
+    before = _state(session_factory)
+    with session_factory() as session:
+        with pytest.raises(InsufficientFundsError):
+            BalanceService(session).withdraw(USER_ID, Decimal("10.01"), "too much", model_id="model")
+        session.rollback()
+    assert _state(session_factory) == before
@@ -0,0 +1,54 @@
+"""install_metrics: счётчики запросов и N+1 в выводе GET /metrics"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import select
+
+from api.middleware import install_metrics
+from database.config import settings
+from database.database import get_async_session
+from models.base_user import BaseUser
+from services.metrics import N_PLUS_ONE_THRESHOLD, instrument_engine
+
+pytestmark = pytest.mark.anyio
+
+METRICS_TOKEN = "metrics-token"
+
+@pytest.fixture
+async def client(async_session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", METRICS_TOKEN)
+    instrument_engine(async_session_factory.kw['bind'].sync_engine, "test")
+
+    app = FastAPI()
+    install_metrics(app)
+
+    @app.get("/test/users/{count}")
+    async def users_one_by_one(count: int):
+        async with async_session_factory() as db:
+            for user_id in range(count):
+                await db.execute(select(BaseUser).where(BaseUser.user_id == str(user_id)))
+        return {}
+
+    async def session():
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_session] = session
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+async def test_metrics_output(client):
+    assert (await client.get("/test/users/1")).status_code == 200
+    assert (await client.get(f"/test/users/{N_PLUS_ONE_THRESHOLD + 1}")).status_code == 200
+
+    response = await client.get("/metrics", headers={"Authorization": f"Bearer {METRICS_TOKEN}"})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert 'http_requests_total{method="GET",route="/test/users/{count}",status="200"} 2' in lines
+    assert 'db_n_plus_one_total{route="/test/users/{count}"} 1' in lines
+    assert 'db_queries_per_request_count{route="/test/users/{count}"} 2' in lines
+
+async def test_metrics_require_token(client):
+    response = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
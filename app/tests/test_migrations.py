@@ -0,0 +1,49 @@
+"""Миграции: база из create_all до Alembic с частью ревизии 0002 доходит до head"""
+import os
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, text
+
+from database.database import APP_DIR, Base, run_migrations
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    yield engine
+    engine.dispose()
+
+def _config(connection) -> Config:
+    config = Config(os.path.join(APP_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(APP_DIR, "migrations"))
+    config.attributes["connection"] = connection
+    return config
+
+def _assert_head(connection) -> None:
+    context = MigrationContext.configure(connection, opts={"compare_type": True})
+    assert context.get_current_revision() == ScriptDirectory.from_config(_config(connection)).get_current_head()
+    assert compare_metadata(context, Base.metadata) == []
+
+def test_fresh_database(engine):
+    with engine.begin() as conn:
+        run_migrations(conn)
+        _assert_head(conn)
+
+def test_legacy_database_with_part_of_0002(engine):
+    with engine.begin() as conn:
+        command.upgrade(_config(conn), "0001")
+        # create_all успел добавить часть изменений 0002, но не версию Alembic
+        conn.execute(text("ALTER TABLE models ADD COLUMN version INTEGER DEFAULT 1 NOT NULL"))
+        conn.execute(text("CREATE TABLE outbox (id INTEGER NOT NULL PRIMARY KEY, routing_key VARCHAR NOT NULL, "
+                          "payload JSON NOT NULL, created_at DATETIME NOT NULL, sent_at DATETIME, "
+                          "attempts INTEGER NOT NULL, last_error VARCHAR)"))
+        conn.execute(text("CREATE INDEX ix_outbox_unsent ON outbox (id) WHERE sent_at IS NULL"))
+        conn.execute(text("DROP TABLE alembic_version"))
+
+    with engine.begin() as conn:
+        run_migrations(conn)
+        _assert_head(conn)
@@ -0,0 +1,134 @@
+"""MicroBatcher и MLWorker: выпуск батчей, повторная доставка после ошибки записи"""
+from typing import Dict, List
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database.config import settings
+from models.base_user import BaseUser, UserRole
+from models.model import BaseMLModel
+from models.prediction_history import PredictionStatus, PredictionTask
+from services.ml_worker import MicroBatcher, MLWorker
+from services.model_registry import ModelRegistry
+from services.prediction_services import PredictionService
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def _message(task_id: str, model_id: str = "model") -> Dict:
+    return {'task_id': task_id, 'model_id': model_id, 'input_data': {}}
+
+def test_batch_released_at_max_size():
+    batcher = MicroBatcher(max_size=3, max_wait=1.0, clock=Clock())
+    for tag in range(2):
+        batcher.add(tag, _message(f"t{tag}"))
+    assert batcher.ready() == []
+    batcher.add(2, _message("t2"))
+    [(model_id, deliveries)] = batcher.ready()
+    assert model_id == "model" and [tag for tag, _ in deliveries] == [0, 1, 2]
+    assert len(batcher) == 0
+
+def test_batch_released_after_max_wait_per_model():
+    clock = Clock()
+    batcher = MicroBatcher(max_size=10, max_wait=0.02, clock=clock)
+    batcher.add(1, _message("old", "a"))
+    clock.now = 0.015
+    batcher.add(2, _message("new", "b"))
+    assert batcher.ready() == []
+    # Отсчёт ожидания идёт от первого сообщения своей модели
+    clock.now = 0.02
+    assert [model_id for model_id, _ in batcher.ready()] == ["a"]
+    clock.now = 0.035
+    assert [model_id for model_id, _ in batcher.ready()] == ["b"]
+
+def test_ready_batches_split_by_max_size():
+    batcher = MicroBatcher(max_size=2, max_wait=1.0, clock=Clock())
+    for tag in range(5):
+        batcher.add(tag, _message(f"t{tag}"))
+    assert [len(deliveries) for _, deliveries in batcher.ready()] == [2, 2, 1]
+
+def test_force_releases_incomplete_batch():
+    batcher = MicroBatcher(max_size=2, max_wait=1.0, clock=Clock())
+    batcher.add(1, _message("t1"))
+    assert batcher.ready() == []
+    assert [len(deliveries) for _, deliveries in batcher.ready(force=True)] == [1]
+    assert len(batcher) == 0
+
+class StubModel:
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    def predict_batch(self, inputs: List[Dict]) -> List[Dict]:
+        return [{'prediction': item['x'] * 2} for item in inputs]
+
+class Channel:
+    def __init__(self):
+        self.acked: List[int] = []
+        self.nacked: List[int] = []
+        self.published: List[bytes] = []
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue):
+        assert requeue
+        self.nacked.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body):
+        self.published.append(body)
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    engine = create_engine(f"sqlite:///{sqlite_db}")
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as session:
+        session.add(BaseUser(user_id="user", username="user", email="user@example.com",
+                             password_hash="", role=UserRole.REGULAR))
+        session.add(BaseMLModel(model_id="model", name="model", owner_id="user", model_type="stub"))
+        session.add(PredictionTask(task_id="task", user_id="user", model_id="model", input_data={'x': 21}))
+        session.commit()
+    yield factory
+    engine.dispose()
+
+@pytest.fixture
+def worker(session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "PREDICTION_CACHE_ENABLED", False)
+    return MLWorker(session_factory=session_factory,
+                    registry=ModelRegistry(loader=StubModel, size_of=lambda path: 0))
+
+MESSAGE = {'task_id': "task", 'user_id': "user", 'model_id': "model", 'input_data': {'x': 21}}
+
+def _task(session_factory) -> PredictionTask:
+    with session_factory() as session:
+        return session.get(PredictionTask, "task")
+
+def test_redelivery_after_failed_write_is_processed(worker, session_factory, monkeypatch):
+    complete_tasks = PredictionService.complete_tasks
+
+    def fail_once(self, results):
+        monkeypatch.setattr(PredictionService, "complete_tasks", complete_tasks)
+        raise OperationalError("UPDATE predictions", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(PredictionService, "complete_tasks", fail_once)
+    channel = Channel()
+
+    worker.batcher.add(1, MESSAGE)
+    worker._flush(channel, force=True)
+    assert channel.nacked == [1] and not channel.acked
+    task = _task(session_factory)
+    assert task.status == PredictionStatus.PENDING and task.worker_id is None
+
+    # Повторная доставка того же сообщения
+    worker.batcher.add(2, MESSAGE)
+    worker._flush(channel, force=True)
+    assert channel.acked == [2]
+    assert len(channel.published) == 1
+    task = _task(session_factory)
+    assert task.status == PredictionStatus.COMPLETED
+    assert task.result == {'prediction': 42}
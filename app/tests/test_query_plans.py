@@ -0,0 +1,42 @@
+"""Горячие запросы ограничены индексом на схеме из миграций (SQLite)"""
+import pytest
+from sqlalchemy import and_, create_engine, or_, select
+
+from benchmarks.query_plans import check_plan, hot_queries
+from database.database import run_migrations
+from models.prediction_history import PredictionTask
+
+HOT_QUERIES = hot_queries("sqlite")
+
+@pytest.fixture(scope="module")
+def connection(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    with engine.begin() as conn:
+        run_migrations(conn)
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+@pytest.mark.parametrize("name, table, index, stmt", HOT_QUERIES, ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_is_index_bounded(connection, name, table, index, stmt):
+    problems, plan = check_plan(connection, table, index, stmt)
+    assert not problems, f"{name}: {'; '.join(problems)}\n{plan}"
+
+def test_or_cursor_fails(connection):
+    # Курсор через OR ограничивает индекс только по user_id, остальное - фильтр
+    stmt = select(PredictionTask.task_id)\
+        .where(
+            PredictionTask.user_id == "user",
+            or_(PredictionTask.created_at < "2026-01-01",
+                and_(PredictionTask.created_at == "2026-01-01", PredictionTask.task_id < "key"))
+        )\
+        .order_by(PredictionTask.created_at.desc(), PredictionTask.task_id.desc())
+    problems, _ = check_plan(connection, "predictions", "ix_predictions_user_id_created_at_task_id", stmt)
+    assert any(problem.startswith("seek on part of") for problem in problems)
+
+def test_sort_outside_index_fails(connection):
+    stmt = select(PredictionTask.task_id)\
+        .where(PredictionTask.user_id == "user")\
+        .order_by(PredictionTask.error)
+    problems, _ = check_plan(connection, "predictions", "ix_predictions_user_id_created_at_task_id", stmt)
+    assert "sort" in problems
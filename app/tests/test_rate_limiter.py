@@ -0,0 +1,80 @@
+"""Token bucket лимита запросов и быстрый отказ check_funds"""
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.dependencies import check_funds
+from models.base_user import BaseUser, UserRole
+from services.auth_services import UserPrincipal
+from services.balance_services import BalanceService, InsufficientFundsError, forget_insufficient
+from services.rate_limiter import LocalBackend, RateLimiter
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_bucket_allows_burst_then_refills():
+    clock = Clock()
+    backend = LocalBackend(clock=clock)
+    limit = (2.0, 3)  # 2 токена в секунду, burst 3
+    assert [backend.acquire("user", limit) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.acquire("user", limit) == pytest.approx(0.5)
+    clock.now = 0.5
+    assert backend.acquire("user", limit) == 0.0
+    # Долгий простой не накапливает больше burst
+    clock.now = 100.0
+    waits = [backend.acquire("user", limit) for _ in range(4)]
+    assert waits[:3] == [0.0, 0.0, 0.0] and waits[3] > 0
+
+def test_buckets_are_per_user():
+    backend = LocalBackend(clock=Clock())
+    limit = (1.0, 1)
+    assert backend.acquire("a", limit) == 0.0
+    assert backend.acquire("a", limit) > 0
+    assert backend.acquire("b", limit) == 0.0
+
+@pytest.mark.anyio
+async def test_limiter_uses_role_limits():
+    limiter = RateLimiter({UserRole.REGULAR: (1.0, 1), UserRole.ADMIN: (0, 0)},
+                          backend=LocalBackend(clock=Clock()))
+    assert await limiter.acquire("user", UserRole.REGULAR) == 0.0
+    assert await limiter.acquire("user", UserRole.REGULAR) == pytest.approx(1.0)
+    # rate 0 - без ограничения
+    assert all([await limiter.acquire("admin", UserRole.ADMIN) == 0.0 for _ in range(10)])
+    assert limiter.rejected == 1
+
+@pytest.fixture
+def balance_service(sqlite_db):
+    engine = create_engine(f"sqlite:///{sqlite_db}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(BaseUser(user_id="user", username="user", email="user@example.com",
+                             password_hash="", role=UserRole.REGULAR))
+        session.commit()
+        service = BalanceService(session)
+        service.deposit(session.get(BaseUser, "user"), Decimal("5"))
+        yield service
+    engine.dispose()
+    forget_insufficient("user")
+
+def test_check_funds_after_failed_withdraw(balance_service):
+    user = UserPrincipal(user_id="user", username="user", role=UserRole.REGULAR, is_active=True)
+    check_funds(user, Decimal("10"))
+
+    with pytest.raises(InsufficientFundsError):
+        balance_service.withdraw("user", Decimal("10"))
+    balance_service.db.rollback()
+    with pytest.raises(HTTPException) as error:
+        check_funds(user, Decimal("10"))
+    assert error.value.status_code == 400
+    # Меньшие суммы ещё проверяются по БД
+    check_funds(user, Decimal("3"))
+
+    # Пополнение сбрасывает отказ
+    balance_service.deposit(balance_service.db.get(BaseUser, "user"), Decimal("10"))
+    check_funds(user, Decimal("10"))
@@ -0,0 +1,74 @@
+"""POST /predictions/results/bulk: события только для завершённых этим запросом задач"""
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from api.routers import predictions
+from database.config import settings
+from database.database import get_async_session
+from models.base_user import BaseUser, UserRole
+from models.model import BaseMLModel
+from models.prediction_history import PredictionStatus, PredictionTask
+from services.rmq.memory import InMemoryBroker, InMemoryPublisher
+from services.rmq.publisher import set_publisher
+from services.task_events import TASK_EVENTS_EXCHANGE
+
+pytestmark = pytest.mark.anyio
+
+WORKER_TOKEN = "worker-token"
+
+@pytest.fixture
+async def client(async_session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_API_TOKEN", WORKER_TOKEN)
+    async with async_session_factory() as db:
+        db.add(BaseUser(user_id="user", username="user", email="user@example.com",
+                        password_hash="", role=UserRole.REGULAR))
+        db.add(BaseMLModel(model_id="model", name="model", owner_id="user", model_type="stub"))
+        db.add(PredictionTask(task_id="open", user_id="user", model_id="model",
+                              status=PredictionStatus.PROCESSING))
+        db.add(PredictionTask(task_id="done", user_id="user", model_id="model",
+                              status=PredictionStatus.COMPLETED, result={'prediction': 1}))
+        await db.commit()
+
+    app = FastAPI()
+    app.include_router(predictions.router)
+
+    async def session():
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_session] = session
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test",
+                                 headers={"X-Worker-Token": WORKER_TOKEN}) as client:
+        yield client
+
+@pytest.fixture
+def broker():
+    broker = InMemoryBroker()
+    set_publisher(InMemoryPublisher(broker))
+    yield broker
+    set_publisher(None)
+
+def _events(broker):
+    events = []
+    while broker.depth(TASK_EVENTS_EXCHANGE):
+        events.append(broker.get(TASK_EVENTS_EXCHANGE))
+    return events
+
+async def test_events_for_applied_results_only(client, broker):
+    results = [
+        {'task_id': "open", 'status': "completed", 'result': {'prediction': 2}},
+        {'task_id': "open", 'status': "failed", 'error': "duplicate"},
+        {'task_id': "done", 'status': "completed", 'result': {'prediction': 3}},
+        {'task_id': "missing", 'status': "completed", 'result': {'prediction': 4}},
+    ]
+    response = await client.post("/predictions/results/bulk", json=results)
+    assert response.status_code == 200
+    assert _events(broker) == [{'task_id': "open", 'user_id': "user", 'status': "completed",
+                                'result': {'prediction': 2}, 'error': None}]
+
+    # Повторная отправка ничего не меняет и событий не публикует
+    response = await client.post("/predictions/results/bulk", json=results)
+    assert response.status_code == 200
+    assert _events(broker) == []
@@ -0,0 +1,32 @@
+"""FairScheduler: веса классов приоритета и round-robin между пользователями"""
+from services.scheduling import FairScheduler, PriorityClass
+
+INTERACTIVE, BULK = PriorityClass.INTERACTIVE, PriorityClass.BULK
+
+def _drain(scheduler: FairScheduler, count: int) -> list:
+    return [scheduler.pop() for _ in range(count)]
+
+def test_weights_share_between_classes():
+    scheduler = FairScheduler({INTERACTIVE: 4, BULK: 1})
+    for i in range(20):
+        scheduler.add(INTERACTIVE, "user", ("interactive", i))
+        scheduler.add(BULK, "user", ("bulk", i))
+    classes = [priority for priority, _ in _drain(scheduler, 10)]
+    assert classes.count("interactive") == 8 and classes.count("bulk") == 2
+
+def test_idle_class_does_not_waste_slots():
+    scheduler = FairScheduler({INTERACTIVE: 4, BULK: 1})
+    for i in range(3):
+        scheduler.add(BULK, "user", i)
+    assert _drain(scheduler, 3) == [0, 1, 2]
+    assert scheduler.pop() is None and len(scheduler) == 0
+
+def test_round_robin_between_users():
+    scheduler = FairScheduler({INTERACTIVE: 1, BULK: 1})
+    # Большой пакет одного пользователя не задерживает задачи других
+    for i in range(5):
+        scheduler.add(BULK, "heavy", f"heavy-{i}")
+    scheduler.add(BULK, "light", "light-0")
+    scheduler.add(BULK, "other", "other-0")
+    assert _drain(scheduler, 4) == ["heavy-0", "light-0", "other-0", "heavy-1"]
+    assert scheduler.depth(BULK) == 3 and scheduler.depth(INTERACTIVE) == 0
@@ -0,0 +1,62 @@
+"""TaskReaper: очередь класса приоритета и события для задач в failed"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from database.config import settings
+from models.base_user import BaseUser, UserRole
+from models.model import BaseMLModel
+from models.outbox import OutboxMessage
+from models.prediction_history import PredictionStatus, PredictionTask
+from services.scheduling import PriorityClass, queue_name
+from services.task_reaper import TaskReaper
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    engine = create_engine(f"sqlite:///{sqlite_db}")
+    factory = sessionmaker(bind=engine, autoflush=False)
+    expired = datetime.utcnow() - timedelta(seconds=settings.TASK_HEARTBEAT_TIMEOUT_SECONDS + 60)
+    with factory() as session:
+        session.add(BaseUser(user_id="user", username="user", email="user@example.com",
+                             password_hash="", role=UserRole.REGULAR))
+        session.add(BaseMLModel(model_id="model", name="model", owner_id="user", model_type="stub"))
+        session.add_all([
+            PredictionTask(task_id="bulk", user_id="user", model_id="model", input_data={'x': 1},
+                           status=PredictionStatus.PROCESSING, heartbeat_at=expired, attempts=1,
+                           priority=PriorityClass.BULK.value),
+            PredictionTask(task_id="interactive", user_id="user", model_id="model", input_data={'x': 2},
+                           status=PredictionStatus.PROCESSING, heartbeat_at=expired, attempts=1),
+            PredictionTask(task_id="exhausted", user_id="user", model_id="model", input_data={'x': 3},
+                           status=PredictionStatus.PROCESSING, heartbeat_at=expired,
+                           attempts=settings.TASK_MAX_ATTEMPTS),
+        ])
+        session.commit()
+    yield factory
+    engine.dispose()
+
+def test_reap_once(session_factory):
+    published = []
+    reaper = TaskReaper(session_factory, publish_events=published.extend)
+    requeued, failed = reaper.reap_once()
+    assert {row.task_id for row in requeued} == {"bulk", "interactive"}
+
+    with session_factory() as session:
+        routing_keys = {message.payload['task_id']: message.routing_key
+                        for message in session.scalars(select(OutboxMessage))}
+    assert routing_keys == {
+        "bulk": queue_name(PriorityClass.BULK, "model"),
+        "interactive": queue_name(PriorityClass.INTERACTIVE, "model"),
+    }
+
+    assert [(event['task_id'], event['status']) for event in published] == [("exhausted", "failed")]
+    assert [row.task_id for row in failed] == ["exhausted"]
+
+def test_failed_publish_does_not_undo_reap(session_factory):
+    def publish_events(events):
+        raise ConnectionError("broker is down")
+
+    TaskReaper(session_factory, publish_events=publish_events).reap_once()
+    with session_factory() as session:
+        assert session.get(PredictionTask, "exhausted").status == PredictionStatus.FAILED